@@ -0,0 +1,350 @@
+from uniswapv2 import UniswapV2
+from localchain import LocalChain, LocalChainProvider
+from retry import RetryPolicy
+from poolstate import PoolTable, POOL_FIELDS
+from eth_account import Account
+from importlib.machinery import SourceFileLoader
+from importlib.util import spec_from_loader, module_from_spec
+from decimal import Decimal
+import argparse
+import json
+import logging
+import traceback
+import sys
+import time
+import tracemalloc
+
+"""
+
+ Benchmarks the UniswapV2 class and the liquidity watcher against an in-process chain (see localchain.py).
+
+ A factory, router, WETH, a value token and N token<>value pools are deployed, and a wallet is given an
+ LP position in every pool. Throughput, latency and RPC calls per operation are then measured for each
+ pool count, so regressions show up without touching a live network.
+
+ Usage:
+   python benchmark.py                            # 10, 50 and 200 pools.
+   python benchmark.py 10 100 1000                # custom pool counts.
+   python benchmark.py --json bench.json          # save the results.
+   python benchmark.py --baseline bench.json      # exit 1 if any operation makes more RPC calls than before.
+   python benchmark.py --memory 10000             # memory per pool of the watcher's pool state.
+
+"""
+
+# throw away development keys, never used outside of the local chain.
+BENCH_PRIVATE_KEY = "0x" + "42" * 32
+WHALE_PRIVATE_KEY = "0x" + "24" * 32
+
+DEFAULT_POOL_COUNTS = [10, 50, 200]
+
+
+def wallet_keys(wallet_count):
+    # the first wallet is always BENCH_PRIVATE_KEY.
+    return [BENCH_PRIVATE_KEY] + ["0x" + ("%02x" % (0x50 + i)) * 32 for i in range(wallet_count - 1)]
+
+
+def load_settings():
+    # liquidity.py imports settings, fall back on the example file when there is no settings.py.
+    if "settings" in sys.modules:
+        return sys.modules["settings"]
+    try:
+        import settings
+    except ImportError:
+        loader = SourceFileLoader("settings", "settings.py.example")
+        settings = module_from_spec(spec_from_loader("settings", loader))
+        loader.exec_module(settings)
+        sys.modules["settings"] = settings
+    return settings
+
+
+def seed_chain(pool_count, wallet_count=1):
+    chain = LocalChain()
+    factory, router, weth = chain.deploy_uniswap()
+    value_token = chain.deploy_token("VALUE", name="Value Token")
+    wallets = [Account.from_key(key).address for key in wallet_keys(wallet_count)]
+    whale = Account.from_key(WHALE_PRIVATE_KEY).address
+    chain.mint(value_token, whale, 10 ** 36)
+    for wallet in wallets:
+        chain.set_native_balance(wallet, 10 ** 24)
+        chain.mint(value_token, wallet, 10 ** 30)
+    chain.mint(weth, whale, 10 ** 30)
+    tokens = []
+    for i in range(pool_count):
+        token = chain.deploy_token("TKN%d" % i, name="Token %d" % i)
+        chain.mint(token, whale, 10 ** 30)
+        # the whale holds most of every pool so removals leave the pool intact.
+        chain.add_liquidity(router, whale, token, value_token, 10 ** 24, (i + 1) * 10 ** 24)
+        for wallet in wallets:
+            chain.mint(token, wallet, 10 ** 27)
+            chain.add_liquidity(router, wallet, token, value_token, 10 ** 21, (i + 1) * 10 ** 21)
+        tokens.append(token)
+    # one weth pool so token -> eth swaps have a route.
+    if tokens:
+        chain.add_liquidity(router, whale, tokens[0], weth, 10 ** 24, 10 ** 24)
+    pairs = [chain.contracts[factory].getPair(None, token, value_token) for token in tokens]
+    return {
+        "chain": chain,
+        "factory": factory,
+        "router": router,
+        "weth": weth,
+        "value_token": value_token,
+        "tokens": tokens,
+        "pairs": pairs,
+    }
+
+
+def create_client(provider, deployment, private_key=BENCH_PRIVATE_KEY, txn_timeout=10, transaction_policy=None):
+    return UniswapV2(
+        private_key,
+        txn_timeout=txn_timeout,
+        gas_price_gwei=1,
+        rpc_host="local",
+        router_address=deployment["router"],
+        factory_address=deployment["factory"],
+        block_explorer_prefix="local:",
+        provider=provider,
+        transaction_policy=transaction_policy
+    )
+
+
+def create_stats_dict(pairs, value_token):
+    # thresholds high enough that a cycle never removes liquidity.
+    import liquidity
+    stats_dict = liquidity.create_stats_dict(dict((pair, Decimal(0)) for pair in pairs))
+    stats_dict['value_token'] = value_token
+    stats_dict['percent_up_remove_liquidity'] = 10 ** 9
+    stats_dict['percent_down_remove_liquidity'] = 100
+    stats_dict['percent_report_change'] = 100
+    return stats_dict
+
+
+def measure(provider, op, pool_count, fn, items):
+    latencies = []
+    errors = 0
+    provider.reset_counts()
+    for item in items:
+        start = time.perf_counter()
+        try:
+            if not fn(item):
+                errors += 1
+        except Exception:
+            logging.debug(traceback.format_exc())
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    count = len(latencies)
+    total = sum(latencies)
+    ordered = sorted(latencies)
+    return {
+        "op": op,
+        "pools": pool_count,
+        "count": count,
+        "errors": errors,
+        "total_s": total,
+        "ops_per_s": count / total if total else 0.0,
+        "mean_ms": 1000 * total / count if count else 0.0,
+        "p95_ms": 1000 * ordered[int(0.95 * (count - 1))] if count else 0.0,
+        "rpc_per_op": provider.total_requests() / count if count else 0.0,
+        "rpc_methods": dict(provider.request_counts),
+        "calls": dict(provider.call_counts),
+    }
+
+
+def run_benchmark(pool_count, cycles=3, txns=5, wallet_count=3):
+    load_settings()
+    import liquidity
+    import multiwallet
+    deployment = seed_chain(pool_count, wallet_count=wallet_count)
+    provider = LocalChainProvider(deployment["chain"])
+    client = create_client(provider, deployment)
+    pairs = deployment["pairs"]
+    value_token = deployment["value_token"]
+    stats_dict = create_stats_dict(pairs, value_token)
+    watchers = multiwallet.share_pair_metadata([
+        {"client": create_client(provider, deployment, key), "stats_dict": create_stats_dict(pairs, value_token)}
+        for key in wallet_keys(wallet_count)])
+
+    def watchers_cycle(_):
+        multiwallet.run_watchers(watchers[0]["client"], watchers)
+        return all(w["stats_dict"]["previous_total_value"] is not None for w in watchers)
+
+    def process_cycle(_):
+        liquidity.process_pools(client, stats_dict)
+        return stats_dict["previous_total_value"] is not None
+
+    def swap(_):
+        receipt = client.swap_tokens_for_eth(deployment["tokens"][0], 1, max_tries=1)
+        return receipt is not None and receipt["status"] == 1
+
+    def routed_swap(_):
+        receipt = client.swap_tokens_for_eth(deployment["tokens"][-1], 1, max_tries=1, max_hops=3)
+        return receipt is not None and receipt["status"] == 1
+
+    def find_route(i):
+        # token i -> token i + 1 only connect through the value token.
+        tokens = deployment["tokens"]
+        return client.find_route(tokens[i], tokens[(i + 1) % len(tokens)], 10 ** 18, max_hops=3) is not None
+
+    def zap(i):
+        # one-sided deposit of the value token, alternating pools.
+        receipt = client.zap_in(pairs[i % len(pairs)], value_token, 10 ** 18)
+        return receipt["status"] == 1
+
+    def recover(pair_address):
+        # one transient timeout, then the read has to recover under the retry policy.
+        provider.inject_failures(1)
+        return client._get_pool_info(pair_address, value_token=value_token, max_tries=3) is not None
+
+    # a short txn_timeout, so a stuck transaction is replaced after a second.
+    congested_client = create_client(provider, deployment, txn_timeout=1,
+        transaction_policy=RetryPolicy(max_tries=8, base_delay=0.1, max_delay=1.0))
+
+    def congested_swap(urgency):
+        # only gas prices above the emergency tier's base fee headroom get mined.
+        def swap_when_congested(_):
+            deployment["chain"].congest(deployment["chain"].gas_price * 3)
+            try:
+                receipt = congested_client._swap_exact_tokens_for_eth(
+                    10 ** 18, 1, [deployment["tokens"][0], congested_client._weth()], congested_client.address,
+                    int(time.time() + 60), urgency=urgency)
+            finally:
+                deployment["chain"].congest(0)
+            return receipt["status"] == 1
+        return swap_when_congested
+
+    def remove(pair_address):
+        receipt = client.remove_liquidity_from_pair(pair_address, max_tries=1)
+        return receipt is not None and receipt["status"] == 1
+
+    # one warm-up cycle, so the timed cycles show the steady state and not the one-off metadata reads.
+    watchers_cycle(None)
+
+    results = [
+        measure(provider, "_get_pool_info", pool_count,
+            lambda pair_address: client._get_pool_info(pair_address, value_token=value_token), pairs),
+        measure(provider, "process_pools", pool_count, process_cycle, range(cycles)),
+        measure(provider, "run_watchers (%s wallets)" % wallet_count, pool_count, watchers_cycle, range(cycles)),
+        measure(provider, "_get_deposited_pairs", pool_count,
+            lambda _: len(client._get_deposited_pairs()) == pool_count, range(1)),
+        measure(provider, "swap_tokens_for_eth", pool_count, swap, range(txns)),
+        measure(provider, "load_route_graph", pool_count, lambda _: client.load_route_graph() is not None, range(1)),
+        measure(provider, "find_route (3 hops)", pool_count, find_route, range(pool_count)),
+        measure(provider, "swap_tokens_for_eth (3 hops)", pool_count, routed_swap, range(txns)),
+        measure(provider, "zap_in", pool_count, zap, range(txns)),
+        measure(provider, "_get_pool_info (after timeout)", pool_count, recover, pairs),
+        measure(provider, "remove_liquidity_from_pair", pool_count, remove, pairs[:txns]),
+        measure(provider, "swap, congested (fast, RBF)", pool_count, congested_swap("fast"), range(txns)),
+        measure(provider, "swap, congested (emergency)", pool_count, congested_swap("emergency"), range(txns)),
+    ]
+    return results
+
+
+def measure_pool_memory(pool_count):
+    # bytes per pool held by the pool table, against the five {address: Decimal} dicts it replaced and the
+    # pool info dicts _get_pool_info() used to allocate for every pool on every cycle. each structure is
+    # charged for the values it keeps alive: the table stores unboxed doubles, the dicts Decimals. of the
+    # five dicts, two shared the current value and three held a baseline of their own. the address strings
+    # are shared by all of them and not counted.
+    addresses = ["0x%040x" % i for i in range(pool_count)]
+    tracemalloc.start()
+
+    start = tracemalloc.get_traced_memory()[0]
+    table = PoolTable(addresses)
+    for pool_id in range(pool_count):
+        for name in POOL_FIELDS:
+            getattr(table, name)[pool_id] = (pool_id + 1) / 7
+    table_bytes = tracemalloc.get_traced_memory()[0] - start
+    del table
+
+    start = tracemalloc.get_traced_memory()[0]
+    values = [Decimal(i + 1) / Decimal(7) for i in range(pool_count)]
+    dicts = [dict(zip(addresses, values)) for _ in range(2)]
+    dicts.extend(dict((address, Decimal(i + 1) / Decimal(7)) for i, address in enumerate(addresses)) for _ in range(3))
+    del values
+    dicts_bytes = tracemalloc.get_traced_memory()[0] - start
+    del dicts
+
+    start = tracemalloc.get_traced_memory()[0]
+    pool_infos = []
+    for i, address in enumerate(addresses):
+        value = Decimal(i + 1) / Decimal(7)
+        pool_infos.append({
+            "reserves": [value + 1, value + 2], "token0": address, "token1": address, "token0_name": address,
+            "token1_name": address, "symbol": address, "token0_amount": value + 3, "token1_amount": value + 4,
+            "total_value": value
+        })
+    pool_info_bytes = tracemalloc.get_traced_memory()[0] - start
+    del pool_infos
+
+    tracemalloc.stop()
+    return {
+        "pools": pool_count,
+        "table_bytes_per_pool": table_bytes / pool_count,
+        "dicts_bytes_per_pool": dicts_bytes / pool_count,
+        "pool_info_bytes_per_pool": pool_info_bytes / pool_count,
+    }
+
+
+def print_results(results):
+    print("%-30s %6s %5s %4s %10s %9s %9s %8s" % (
+        "operation", "pools", "n", "err", "ops/s", "mean ms", "p95 ms", "rpc/op"))
+    for r in results:
+        print("%-30s %6d %5d %4d %10.1f %9.3f %9.3f %8.1f" % (
+            r["op"], r["pools"], r["count"], r["errors"], r["ops_per_s"], r["mean_ms"], r["p95_ms"], r["rpc_per_op"]))
+
+
+def compare_results(results, baseline_file, latency_tolerance):
+    # rpc counts are deterministic, so any increase is a regression. latency only warns.
+    with open(baseline_file) as fp:
+        baseline = dict(((r["op"], r["pools"]), r) for r in json.load(fp))
+    regressions = 0
+    for r in results:
+        previous = baseline.get((r["op"], r["pools"]))
+        if previous is None:
+            continue
+        if r["rpc_per_op"] > previous["rpc_per_op"]:
+            logging.warning('REGRESSION: %s (%s pools) rpc/op %.1f -> %.1f.' % (
+                r["op"], r["pools"], previous["rpc_per_op"], r["rpc_per_op"]))
+            regressions += 1
+        if previous["mean_ms"] and r["mean_ms"] > previous["mean_ms"] * (1 + latency_tolerance):
+            logging.warning('SLOWER: %s (%s pools) mean %.3fms -> %.3fms.' % (
+                r["op"], r["pools"], previous["mean_ms"], r["mean_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark UniswapV2 against an in-process chain.")
+    parser.add_argument("pools", nargs="*", type=int, default=DEFAULT_POOL_COUNTS, help="pool counts to benchmark.")
+    parser.add_argument("--cycles", type=int, default=3, help="process_pools cycles per pool count.")
+    parser.add_argument("--txns", type=int, default=5, help="swaps and removals per pool count.")
+    parser.add_argument("--wallets", type=int, default=3, help="wallets watched by the multi wallet cycle.")
+    parser.add_argument("--json", help="write the results to this file.")
+    parser.add_argument("--baseline", help="compare against results saved with --json.")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5, help="warn when mean latency grows by this fraction.")
+    parser.add_argument("--memory", type=int, help="only report memory per pool for this many pools.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the watcher logs.")
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s: %(message)s'
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format=log_format, stream=sys.stdout)
+
+    if args.memory:
+        memory = measure_pool_memory(args.memory)
+        print("%s pools. pool table: %.0f bytes/pool, %s fields held. five value dicts: %.0f bytes/pool. "
+            "pool info dicts no longer built per cycle: %.0f bytes/pool." % (
+            memory["pools"], memory["table_bytes_per_pool"], len(POOL_FIELDS), memory["dicts_bytes_per_pool"], memory["pool_info_bytes_per_pool"]))
+        return
+
+    results = []
+    for pool_count in args.pools:
+        results.extend(run_benchmark(pool_count, cycles=args.cycles, txns=args.txns, wallet_count=args.wallets))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2)
+    if args.baseline and compare_results(results, args.baseline, args.latency_tolerance) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
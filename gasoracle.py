@@ -0,0 +1,109 @@
+from statistics import median
+import logging
+import traceback
+
+"""
+
+ Gas price oracle built on eth_feeHistory.
+
+ One eth_feeHistory call samples the last block_count blocks' base fees and the priority fees paid
+ at every urgency tier's percentile. The prices are cached until the next block, so any number of
+ transactions built in the same block cost one eth_blockNumber call each. Chains without fee history
+ fall back to the static gas price from settings.
+
+ Urgency tiers:
+   routine    everyday swaps and approvals, the 25th percentile tip on the next base fee.
+   fast       removals, the 60th percentile tip and room for the base fee to rise 25%.
+   emergency  exits that have to land now, the 90th percentile tip and room for the base fee to double.
+
+"""
+
+# urgency: (priority fee percentile, next base fee multiplier)
+URGENCY_TIERS = {
+    "routine": (25, 1.0),
+    "fast": (60, 1.25),
+    "emergency": (90, 2.0),
+}
+
+# nodes only accept a replacement that pays at least 10% more than the transaction it replaces.
+REPLACEMENT_BUMP_PERCENT = 12.5
+
+
+class GasOracle():
+
+    def __init__(self, w3, fallback_gas_price, max_gas_price=None, block_count=10, tiers=None,
+            bump_percent=REPLACEMENT_BUMP_PERCENT):
+        self.w3 = w3
+        # gas prices are in wei.
+        self.fallback_gas_price = fallback_gas_price
+        self.max_gas_price = max_gas_price
+        self.block_count = block_count
+        self.tiers = tiers or URGENCY_TIERS
+        self.bump_percent = bump_percent
+        self.stats = {"hits": 0, "refreshes": 0, "fallbacks": 0}
+        self._block_number = None
+        self._prices = None
+
+    def gas_price(self, urgency="routine"):
+        if urgency not in self.tiers:
+            raise Exception("Unknown urgency %s, use one of: %s." % (urgency, ", ".join(self.tiers)))
+        prices = self.estimate()
+        if prices is None:
+            return self._cap(self.fallback_gas_price)
+        return self._cap(prices[urgency])
+
+    def bump(self, gas_price, urgency="routine"):
+        # replacement price for a stuck transaction: enough of a bump for the node to accept it,
+        # or the tier's current price when fees have moved up further than that. None when
+        # max_gas_price leaves no room for a higher price, keep waiting on the one already sent.
+        bumped = int(gas_price * (100 + self.bump_percent) / 100) + 1
+        bumped = self._cap(max(bumped, self.gas_price(urgency)))
+        if bumped <= gas_price:
+            return None
+        return bumped
+
+    def estimate(self):
+        # {urgency: gas price} for the latest block, None when the chain has no usable fee history.
+        try:
+            block_number = self.w3.eth.block_number
+        except:
+            logging.debug(traceback.format_exc())
+            block_number = None
+        if block_number is not None and block_number == self._block_number:
+            self.stats["hits"] += 1
+            return self._prices
+        prices = self._read_fee_history()
+        if prices is None:
+            self.stats["fallbacks"] += 1
+        else:
+            self.stats["refreshes"] += 1
+        self._block_number = block_number
+        self._prices = prices
+        return prices
+
+    def _read_fee_history(self):
+        urgencies = sorted(self.tiers, key=lambda urgency: self.tiers[urgency][0])
+        percentiles = [self.tiers[urgency][0] for urgency in urgencies]
+        try:
+            history = self.w3.eth.fee_history(self.block_count, "latest", percentiles)
+        except:
+            logging.debug(traceback.format_exc())
+            return None
+        # the last base fee is the next block's.
+        base_fees = history.get("baseFeePerGas") or []
+        rewards = history.get("reward") or []
+        if not base_fees or base_fees[-1] == 0:
+            return None
+        prices = {}
+        for i, urgency in enumerate(urgencies):
+            tips = [block[i] for block in rewards if len(block) > i]
+            tip = int(median(tips)) if tips else 0
+            prices[urgency] = int(base_fees[-1] * self.tiers[urgency][1]) + tip
+        logging.debug('Gas prices (gwei): %s' % ", ".join(
+            "%s %s" % (urgency, self.w3.fromWei(prices[urgency], "gwei")) for urgency in urgencies))
+        return prices
+
+    def _cap(self, gas_price):
+        if self.max_gas_price is not None and gas_price > self.max_gas_price:
+            return self.max_gas_price
+        return gas_price
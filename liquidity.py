@@ -1,6 +1,9 @@
 from concurrent.futures import process
 from uniswapv2 import UniswapV2
-from utils import  decimal_round, is_percent_down, is_percent_up, pancakeswap_api_get_price
+from poolstate import PoolTable, is_set
+from queryserver import SnapshotStore, QueryServer, create_snapshot
+from utils import  decimal_round, is_percent_down, is_percent_up
+from pricefeed import get_price_feed
 from decimal import Decimal
 import logging
 import traceback
@@ -9,6 +12,18 @@ import os
 import time
 from settings import *
 
+try:
+    from settings import USE_GAS_ORACLE, MAX_GAS_PRICE_GWEI
+except ImportError:
+    USE_GAS_ORACLE = True
+    MAX_GAS_PRICE_GWEI = None
+
+try:
+    from settings import QUERY_SERVER_PORT, QUERY_SERVER_SOCKET
+except ImportError:
+    QUERY_SERVER_PORT = None
+    QUERY_SERVER_SOCKET = None
+
 VERSION = "1.2"
 
 """
@@ -29,16 +44,7 @@ def main():
     logging.info('Uniswap Liquidity Watcher v%s Started!' % VERSION)
     
     # create my spiffy new uniswap class. works for all networks and forks.
-    # Added uniswap object initialization every loop incase connection is lost or something.
-    uniswap = UniswapV2(
-        PRIVATE_KEY, 
-        txn_timeout=TXN_TIMEOUT, 
-        gas_price_gwei=GAS_PRICE_IN_WEI, 
-        rpc_host=RPC_HOST, 
-        router_address=ROUTER_ADDRESS,
-        factory_address=FACTORY_ADDRESS,
-        block_explorer_prefix=BLOCK_EXPLORER_PREFIX
-    )
+    uniswap = create_client()
     
     # r = uniswap.remove_liquidity_from_pair("0xC79245BA0248Abe8a385d588C0a9D3DB261B453c")
     # logging.info(r)
@@ -48,38 +54,66 @@ def main():
     # if you want to refresh your list of pools, then delete pools.csv 
     # then run the program again.
     pools_dict = load_pools_dict(uniswap)
-    stats_dict = {
-        'previous_worth_dict': {},
-        'percent_changed_dict': {},
-        'percent_remove_dict': {},
-        'initial_report_dict': {},
+    stats_dict = create_stats_dict(pools_dict)
+    
+    # optional local API, so dashboards read what the watcher already fetched (see queryserver.py).
+    snapshot_store = None
+    if QUERY_SERVER_PORT is not None or QUERY_SERVER_SOCKET is not None:
+        snapshot_store = SnapshotStore()
+        QueryServer(snapshot_store, port=QUERY_SERVER_PORT, unix_socket=QUERY_SERVER_SOCKET).start()
+    
+    while True:
+        stats_dict = run_cycle(uniswap, stats_dict)
+        if snapshot_store is not None:
+            snapshot_store.publish(create_snapshot(uniswap, stats_dict))
+        time.sleep(CHECK_MINUTE_DELAY * 60)
+
+def create_client(provider=None):
+    # provider is optional, and replaces the HTTP connection to RPC_HOST (see rpcreplay.py).
+    return UniswapV2(
+        PRIVATE_KEY, 
+        txn_timeout=TXN_TIMEOUT, 
+        gas_price_gwei=GAS_PRICE_IN_WEI, 
+        rpc_host=RPC_HOST, 
+        router_address=ROUTER_ADDRESS,
+        factory_address=FACTORY_ADDRESS,
+        block_explorer_prefix=BLOCK_EXPLORER_PREFIX,
+        provider=provider,
+        gas_oracle=USE_GAS_ORACLE,
+        max_gas_price_gwei=MAX_GAS_PRICE_GWEI
+    )
+
+def create_stats_dict(pools_dict):
+    # per pool values live in the pool table, see poolstate.py.
+    return {
+        'pool_table': PoolTable(pools_dict),
         'previous_total_value': None,
+        'current_total_value': None,
         'value_token': VALUE_TOKEN,
         'value_token_name': None,
+        # block number at the start of the last cycle, None when it could not be read.
+        'cycle_block_number': None,
         'initial_report_time': time.time(),
         'percent_remove_time': time.time(),
         'percent_up_remove_liquidity': PERCENT_UP_REMOVE_LIQUIDITY,
         'percent_down_remove_liquidity': PERCENT_DOWN_REMOVE_LIQUIDITY,
-        'percent_report_change': PERCENT_REPORT_CHANGE,
-        'pools_dict': pools_dict
+        'percent_report_change': PERCENT_REPORT_CHANGE
     }
+
+def run_cycle(client, stats_dict, read_pools=None):
+    # Do not reset the timer until the end of the loop.
+    if time.time() - stats_dict["initial_report_time"] > (REPORT_ALL_POOLS_EVERY_MINS * 60):
+        stats_dict["pool_table"].reset_reported()
     
-    while True:
-        
-        # Do not reset the timer until the end of the loop.
-        if time.time() - stats_dict["initial_report_time"] > (REPORT_ALL_POOLS_EVERY_MINS * 60):
-            stats_dict["initial_report_dict"] = {}
-        
-        # Force the percent remove dict to reset so that updated values are used when comparing percent up/down
-        # So that it doesnt have the same starting values for all its run length time.
-        # Resets this dict every 5 hours.
-        if time.time() - stats_dict["percent_remove_time"] > (60 * 60 * 5):
-            stats_dict["percent_remove_dict"] = {}
-            stats_dict["percent_remove_time"] = time.time()
-        
-        # check if we have to remove any pools from liquidity by analyzing the overall value.
-        stats_dict = process_pools(uniswap, stats_dict)
-        time.sleep(CHECK_MINUTE_DELAY * 60)
+    # Force the percent remove dict to reset so that updated values are used when comparing percent up/down
+    # So that it doesnt have the same starting values for all its run length time.
+    # Resets this dict every 5 hours.
+    if time.time() - stats_dict["percent_remove_time"] > (60 * 60 * 5):
+        stats_dict["pool_table"].reset_remove_baselines()
+        stats_dict["percent_remove_time"] = time.time()
+    
+    # check if we have to remove any pools from liquidity by analyzing the overall value.
+    return process_pools(client, stats_dict, read_pools=read_pools)
 
 def load_pools_dict(client):
     # loads pools from a csv file, so we dont have to search all liquidity pools
@@ -95,78 +129,99 @@ def load_pools_dict(client):
     save_pools_file(pools_dict, "pools.csv")
     return pools_dict
 
-def get_pair_info(client, pair_address, value_token):
-    pool_info = None
-    for _ in range(RPC_ATTEMPTS):
-        pool_info = client._get_pool_info(
-            pair_address,  # The liquidity pair contract address.
-            value_token=value_token  # Value token is jewel.
-        )
-        if pool_info:
-            break
-    return pool_info
-
-def process_pools(client, stats_dict):
+def read_pool(client, table, pool_id, value_token):
+    # retried with backoff under the client's read policy.
+    try:
+        client.read_policy.call(
+            lambda: client._read_pool_row(table, pool_id, value_token=value_token),
+            max_tries=RPC_ATTEMPTS, description='pool %s' % table.address[pool_id])
+        return True
+    except:
+        logging.debug(traceback.format_exc())
+    return False
+
+def set_cycle_block_number(client, stats_dict):
+    # every pool row keeps its own read block, this one tags the cycle as a whole (see queryserver.py).
+    try:
+        stats_dict["cycle_block_number"] = client._get_block_number(max_age=0)
+    except:
+        logging.debug(traceback.format_exc())
+        stats_dict["cycle_block_number"] = None
+
+def process_pools(client, stats_dict, read_pools=None):
+    # read_pools can hold the ids of pools already read into the table for this account (see multiwallet.py).
     if not stats_dict["value_token_name"]:
         stats_dict["value_token_name"] = client._get_symbol(stats_dict["value_token"])
         logging.info("Interval: %s. Currency: %s." % (CHECK_MINUTE_DELAY, stats_dict["value_token_name"]))
+    if read_pools is None:
+        set_cycle_block_number(client, stats_dict)
     current_pool_value = Decimal(0.0)
     remove_pools = []
-    # Get all pool info
-    for pair_address in stats_dict["pools_dict"]:
-        # Get the pool info form pair address.
-        pool_info = get_pair_info(client, pair_address, stats_dict["value_token"])
-        if not pool_info:
-            time.sleep(30)
+    table = stats_dict["pool_table"]
+    # Refresh every pool row in place.
+    for pool_id in table.pool_ids():
+        pair_address = table.address[pool_id]
+        if read_pools is not None:
+            updated = pool_id in read_pools
+        else:
+            updated = read_pool(client, table, pool_id, stats_dict["value_token"])
+        if not updated:
+            # already retried, try again next cycle.
             continue
-        # Tracking dicts for watching percent change.
-        stats_dict["pools_dict"][pair_address] = pool_info["total_value"]
-        if pair_address not in stats_dict["initial_report_dict"]:
-            stats_dict["initial_report_dict"][pair_address] = pool_info["total_value"]
+        value = table.value[pool_id]
+        previous_value = table.previous_value[pool_id]
+        # Baselines for watching percent change.
+        if not table.reported[pool_id]:
+            table.reported[pool_id] = 1
+            metadata = client._get_pair_metadata(pair_address)
+            token0_amount, token1_amount = table.token_amounts(pool_id)
             logging.info('%s. %s: %s. %s: %s. value: %s.' % (
-                pool_info["symbol"], pool_info["token0_name"], decimal_round(pool_info["token0_amount"], 5),
-                pool_info["token1_name"], decimal_round(pool_info["token1_amount"], 5), decimal_round(pool_info["total_value"], 5)))
-        if pair_address not in stats_dict["percent_changed_dict"]:
-            stats_dict["percent_changed_dict"][pair_address] = pool_info["total_value"]
-        if pair_address not in stats_dict["percent_remove_dict"]:
-            stats_dict["percent_remove_dict"][pair_address] = pool_info["total_value"]
+                client._pool_symbol(pair_address), metadata["token0_name"], decimal_round(Decimal(token0_amount), 5),
+                metadata["token1_name"], decimal_round(Decimal(token1_amount), 5), decimal_round(Decimal(value), 5)))
+        if not is_set(table.report_baseline[pool_id]):
+            table.report_baseline[pool_id] = value
+        if not is_set(table.remove_baseline[pool_id]):
+            table.remove_baseline[pool_id] = value
         
-        # Check the percent change of the total value of pool using the tracking dicts above.
+        # Check the percent change of the total value of pool using the baselines above.
         # on X% down this will remove all liquidity from target pair. (see options)
-        if pair_address in stats_dict["previous_worth_dict"]:
-            if pool_info["total_value"] > stats_dict["previous_worth_dict"][pair_address]:
-                if is_percent_up(stats_dict["percent_changed_dict"][pair_address], pool_info["total_value"], stats_dict["percent_report_change"]) is True:
+        if is_set(previous_value):
+            if value > previous_value:
+                if is_percent_up(table.report_baseline[pool_id], value, stats_dict["percent_report_change"]) is True:
                     logging.info('%s is ⬆ to %s from %s!' % (
-                        pool_info["symbol"], round(pool_info["total_value"], 7), round(stats_dict["previous_worth_dict"][pair_address], 7)))
-                    stats_dict["percent_changed_dict"][pair_address] = pool_info["total_value"]
-                if is_percent_up(stats_dict["percent_remove_dict"][pair_address], pool_info["total_value"], stats_dict["percent_up_remove_liquidity"]) is True:
+                        client._pool_symbol(pair_address), round(value, 7), round(previous_value, 7)))
+                    table.report_baseline[pool_id] = value
+                if is_percent_up(table.remove_baseline[pool_id], value, stats_dict["percent_up_remove_liquidity"]) is True:
                     logging.info('ATTENTION: %s is UP UP UP %s percent since bot started.' % (
-                        pool_info["symbol"], stats_dict["percent_down_remove_liquidity"]))
-                    # set the start dicts total value, so it doesnt report on loop
-                    stats_dict["percent_remove_dict"][pair_address] = pool_info["total_value"]
+                        client._pool_symbol(pair_address), stats_dict["percent_down_remove_liquidity"]))
+                    # set the baseline, so it doesnt report on loop
+                    table.remove_baseline[pool_id] = value
                     # remove all liquidity from pair address.
-                    remove_result = client.remove_liquidity_from_pair(pair_address, max_tries=RPC_ATTEMPTS)
+                    remove_result = client.remove_liquidity_from_pair(pair_address, max_tries=RPC_ATTEMPTS, urgency="fast")
                     logging.info('remove result: %s.' % remove_result)
                     # add to remove list, so that pair is removed from processing.
                     remove_pools.append(pair_address)
-            elif pool_info["total_value"] < stats_dict["previous_worth_dict"][pair_address]:
-                if is_percent_down(stats_dict["percent_changed_dict"][pair_address], pool_info["total_value"], stats_dict["percent_report_change"]) is True:
+            elif value < previous_value:
+                if is_percent_down(table.report_baseline[pool_id], value, stats_dict["percent_report_change"]) is True:
                     logging.info('%s is ⬇ to %s from %s!' % (
-                        pool_info["symbol"], round(pool_info["total_value"], 7), round(stats_dict["previous_worth_dict"][pair_address], 7)))
-                    stats_dict["percent_changed_dict"][pair_address] = pool_info["total_value"]
-                if is_percent_down(stats_dict["percent_remove_dict"][pair_address], pool_info["total_value"], stats_dict["percent_down_remove_liquidity"]) is True:
+                        client._pool_symbol(pair_address), round(value, 7), round(previous_value, 7)))
+                    table.report_baseline[pool_id] = value
+                if is_percent_down(table.remove_baseline[pool_id], value, stats_dict["percent_down_remove_liquidity"]) is True:
                     logging.info('WARNING: %s is down %s percent since bot started.' % (
-                        pool_info["symbol"], stats_dict["percent_down_remove_liquidity"]))
-                    # set the start dicts total value, so it doesnt report on loop
-                    stats_dict["percent_remove_dict"][pair_address] = pool_info["total_value"]
-                    # remove all liquidity from pair address.
-                    remove_result = client.remove_liquidity_from_pair(pair_address, max_tries=RPC_ATTEMPTS)
+                        client._pool_symbol(pair_address), stats_dict["percent_down_remove_liquidity"]))
+                    # set the baseline, so it doesnt report on loop
+                    table.remove_baseline[pool_id] = value
+                    # remove all liquidity from pair address. an exit from a falling pool pays for the fastest inclusion.
+                    remove_result = client.remove_liquidity_from_pair(
+                        pair_address, max_tries=RPC_ATTEMPTS, urgency="emergency")
                     logging.info('remove result: %s.' % remove_result)
                     # add to remove list, so that pair is removed from processing.
                     remove_pools.append(pair_address)
                     
-        stats_dict["previous_worth_dict"][pair_address] = pool_info["total_value"]
-        current_pool_value += Decimal(pool_info["total_value"])
+        table.previous_value[pool_id] = value
+        current_pool_value += Decimal(str(value))
+    
+    stats_dict["current_total_value"] = current_pool_value
         
     if stats_dict["previous_total_value"] and (is_percent_down(stats_dict["previous_total_value"], current_pool_value, stats_dict["percent_report_change"]) is True or \
         is_percent_up(stats_dict["previous_total_value"], current_pool_value, stats_dict["percent_report_change"])) is True:
@@ -178,7 +233,7 @@ def process_pools(client, stats_dict):
     
     # Reset counter for reporting the pool total values.
     if time.time() - stats_dict["initial_report_time"] > (REPORT_ALL_POOLS_EVERY_MINS * 60):
-        stats_dict["initial_report_dict"] = time.time()
+        stats_dict["initial_report_time"] = time.time()
         report_total = True
     
     if report_total is True:
@@ -186,10 +241,7 @@ def process_pools(client, stats_dict):
         logging.info("Total (in %s): %s" % (stats_dict["value_token_name"], str(decimal_round(current_pool_value, 8))))
         
     for remove in remove_pools:
-        try:
-            del stats_dict["pools_dict"][remove]
-        except:
-            logging.debug(traceback.format_exc())
+        stats_dict["pool_table"].remove(remove)
             
     return stats_dict
 
@@ -216,9 +268,11 @@ def save_pools_file(pool_dict, filename):
         logging.debug(traceback.format_exc())
 
 def get_token_price(token):
-    price_dict = pancakeswap_api_get_price(token)
-    token_price = price_dict["data"]["price"]
-    return token_price
+    return get_price_feed().get_token_price(token)
+
+def get_token_prices(tokens):
+    # {token: price}, fetched at the same time.
+    return get_price_feed().get_token_prices(tokens)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
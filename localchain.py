@@ -0,0 +1,639 @@
+from web3 import Web3
+from web3.providers.base import BaseProvider
+from eth_account import Account
+from collections import Counter
+from requests.exceptions import Timeout
+from math import isqrt
+import itertools
+import json
+import time
+import rlp
+import logging
+from utils import to_checksum, read_json_file
+from uniswapv2 import ROUTER_ABI_FILE, PAIR_ABI_FILE, FACTORY_ABI_FILE, ERC20_ABI_FILE
+
+try:
+    from eth_abi import encode as abi_encode, decode as abi_decode
+except ImportError:
+    from eth_abi import encode_abi as abi_encode, decode_abi as abi_decode
+
+"""
+
+ In-process stand-in for a UniswapV2 deployment.
+
+ LocalChain keeps the state of a factory, router, pairs and ERC20 tokens in plain python
+ and LocalChainProvider serves it over the JSON-RPC interface web3 expects, so the UniswapV2
+ class can run unchanged without a live network. Only the calls the UniswapV2 class makes are
+ supported. Every request is counted so benchmarks can report RPC usage per operation.
+
+"""
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+MAX_UINT256 = 2 ** 256 - 1
+MINIMUM_LIQUIDITY = 1000
+DEFAULT_GAS = 250000
+
+
+class Revert(Exception):
+    pass
+
+
+class Msg():
+    def __init__(self, sender, value=0):
+        self.sender = sender
+        self.value = value
+
+
+def _require(condition, message):
+    if not condition:
+        raise Revert(message)
+
+
+def _sort_tokens(token_a, token_b):
+    _require(token_a != token_b, "UniswapV2Library: IDENTICAL_ADDRESSES")
+    if int(token_a, 16) < int(token_b, 16):
+        return token_a, token_b
+    return token_b, token_a
+
+
+def _load_selectors(abi_file):
+    # maps the 4 byte selector of every abi function to its name, input and output types.
+    selectors = {}
+    for item in json.loads(read_json_file(abi_file)):
+        if item.get("type") != "function":
+            continue
+        in_types = [i["type"] for i in item["inputs"]]
+        out_types = [o["type"] for o in item["outputs"]]
+        signature = "%s(%s)" % (item["name"], ",".join(in_types))
+        selectors[bytes(Web3.keccak(text=signature)[:4])] = (item["name"], in_types, out_types)
+    return selectors
+
+
+class Token():
+    kind = "erc20"
+
+    def __init__(self, chain, address, symbol, name, decimals):
+        self.chain = chain
+        self.address = address
+        self._symbol = symbol
+        self._name = name
+        self._decimals = decimals
+        self._total_supply = 0
+        self._balances = {}
+        self._allowances = {}
+
+    # ABI methods.
+
+    def name(self, msg):
+        return self._name
+
+    def symbol(self, msg):
+        return self._symbol
+
+    def decimals(self, msg):
+        return self._decimals
+
+    def totalSupply(self, msg):
+        return self._total_supply
+
+    def balanceOf(self, msg, owner):
+        return self._balances.get(owner, 0)
+
+    def allowance(self, msg, owner, spender):
+        return self._allowances.get((owner, spender), 0)
+
+    def approve(self, msg, spender, amount):
+        self._allowances[(msg.sender, spender)] = amount
+        return True
+
+    def transfer(self, msg, to, amount):
+        self._move(msg.sender, to, amount)
+        return True
+
+    def transferFrom(self, msg, src, dst, amount):
+        self._check_allowance(src, msg.sender, amount)
+        self._check_balance(src, amount)
+        self._spend_allowance(src, msg.sender, amount)
+        self._move(src, dst, amount)
+        return True
+
+    # Internal helpers. Checks never mutate, so callers validate everything before moving funds.
+
+    def _check_balance(self, owner, amount):
+        _require(self._balances.get(owner, 0) >= amount, "%s: transfer amount exceeds balance" % self._symbol)
+
+    def _check_allowance(self, owner, spender, amount):
+        _require(self._allowances.get((owner, spender), 0) >= amount, "%s: transfer amount exceeds allowance" % self._symbol)
+
+    def _spend_allowance(self, owner, spender, amount):
+        allowed = self._allowances.get((owner, spender), 0)
+        if allowed != MAX_UINT256:
+            self._allowances[(owner, spender)] = allowed - amount
+
+    def _move(self, src, dst, amount):
+        self._check_balance(src, amount)
+        self._balances[src] = self._balances.get(src, 0) - amount
+        self._balances[dst] = self._balances.get(dst, 0) + amount
+
+    def _mint(self, to, amount):
+        self._balances[to] = self._balances.get(to, 0) + amount
+        self._total_supply += amount
+
+    def _burn(self, owner, amount):
+        self._check_balance(owner, amount)
+        self._balances[owner] -= amount
+        self._total_supply -= amount
+
+
+class Pair(Token):
+    kind = "pair"
+
+    def __init__(self, chain, address, factory, token0, token1):
+        Token.__init__(self, chain, address, "UNI-V2", "Uniswap V2", 18)
+        self._factory = factory
+        self._token0 = token0
+        self._token1 = token1
+        self._reserve0 = 0
+        self._reserve1 = 0
+        self._block_timestamp_last = 0
+
+    def token0(self, msg):
+        return self._token0
+
+    def token1(self, msg):
+        return self._token1
+
+    def factory(self, msg):
+        return self._factory
+
+    def getReserves(self, msg):
+        return self._reserve0, self._reserve1, self._block_timestamp_last
+
+    def MINIMUM_LIQUIDITY(self, msg):
+        return MINIMUM_LIQUIDITY
+
+    def _sync(self):
+        self._reserve0 = self.chain.contracts[self._token0]._balances.get(self.address, 0)
+        self._reserve1 = self.chain.contracts[self._token1]._balances.get(self.address, 0)
+        self._block_timestamp_last = int(time.time()) % 2 ** 32
+
+    def _mint_liquidity(self, to):
+        balance0 = self.chain.contracts[self._token0]._balances.get(self.address, 0)
+        balance1 = self.chain.contracts[self._token1]._balances.get(self.address, 0)
+        amount0 = balance0 - self._reserve0
+        amount1 = balance1 - self._reserve1
+        if self._total_supply == 0:
+            liquidity = isqrt(amount0 * amount1) - MINIMUM_LIQUIDITY
+            self._mint(ZERO_ADDRESS, MINIMUM_LIQUIDITY)
+        else:
+            liquidity = min(amount0 * self._total_supply // self._reserve0, amount1 * self._total_supply // self._reserve1)
+        _require(liquidity > 0, "UniswapV2: INSUFFICIENT_LIQUIDITY_MINTED")
+        self._mint(to, liquidity)
+        self._sync()
+        return liquidity
+
+    def _burn_liquidity(self, to):
+        token0 = self.chain.contracts[self._token0]
+        token1 = self.chain.contracts[self._token1]
+        liquidity = self._balances.get(self.address, 0)
+        amount0 = liquidity * token0._balances.get(self.address, 0) // self._total_supply
+        amount1 = liquidity * token1._balances.get(self.address, 0) // self._total_supply
+        _require(amount0 > 0 and amount1 > 0, "UniswapV2: INSUFFICIENT_LIQUIDITY_BURNED")
+        self._burn(self.address, liquidity)
+        token0._move(self.address, to, amount0)
+        token1._move(self.address, to, amount1)
+        self._sync()
+        return amount0, amount1
+
+
+class Factory():
+    kind = "factory"
+
+    def __init__(self, chain, address):
+        self.chain = chain
+        self.address = address
+        self._pairs = {}
+        self._all_pairs = []
+
+    def getPair(self, msg, token_a, token_b):
+        if token_a == token_b:
+            return ZERO_ADDRESS
+        return self._pairs.get(_sort_tokens(token_a, token_b), ZERO_ADDRESS)
+
+    def allPairs(self, msg, index):
+        _require(index < len(self._all_pairs), "index out of range")
+        return self._all_pairs[index]
+
+    def allPairsLength(self, msg):
+        return len(self._all_pairs)
+
+    def createPair(self, msg, token_a, token_b):
+        token0, token1 = _sort_tokens(token_a, token_b)
+        _require((token0, token1) not in self._pairs, "UniswapV2: PAIR_EXISTS")
+        address = self.chain._new_address()
+        self.chain.contracts[address] = Pair(self.chain, address, self.address, token0, token1)
+        self._pairs[(token0, token1)] = address
+        self._all_pairs.append(address)
+        return address
+
+    def feeTo(self, msg):
+        return ZERO_ADDRESS
+
+    def feeToSetter(self, msg):
+        return ZERO_ADDRESS
+
+
+class Router():
+    kind = "router"
+
+    def __init__(self, chain, address, factory, weth):
+        self.chain = chain
+        self.address = address
+        self._factory = factory
+        self._weth = weth
+
+    def WETH(self, msg):
+        return self._weth
+
+    def factory(self, msg):
+        return self._factory
+
+    def quote(self, msg, amount_a, reserve_a, reserve_b):
+        _require(amount_a > 0, "UniswapV2Library: INSUFFICIENT_AMOUNT")
+        _require(reserve_a > 0 and reserve_b > 0, "UniswapV2Library: INSUFFICIENT_LIQUIDITY")
+        return amount_a * reserve_b // reserve_a
+
+    def getAmountOut(self, msg, amount_in, reserve_in, reserve_out):
+        _require(amount_in > 0, "UniswapV2Library: INSUFFICIENT_INPUT_AMOUNT")
+        _require(reserve_in > 0 and reserve_out > 0, "UniswapV2Library: INSUFFICIENT_LIQUIDITY")
+        amount_in_with_fee = amount_in * 997
+        return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+    def getAmountIn(self, msg, amount_out, reserve_in, reserve_out):
+        _require(amount_out > 0, "UniswapV2Library: INSUFFICIENT_OUTPUT_AMOUNT")
+        _require(reserve_in > 0 and reserve_out > amount_out, "UniswapV2Library: INSUFFICIENT_LIQUIDITY")
+        return reserve_in * amount_out * 1000 // ((reserve_out - amount_out) * 997) + 1
+
+    def getAmountsOut(self, msg, amount_in, path):
+        _require(len(path) >= 2, "UniswapV2Library: INVALID_PATH")
+        amounts = [amount_in]
+        for i in range(len(path) - 1):
+            reserve_in, reserve_out = self._get_reserves(path[i], path[i + 1])
+            amounts.append(self.getAmountOut(msg, amounts[i], reserve_in, reserve_out))
+        return amounts
+
+    def getAmountsIn(self, msg, amount_out, path):
+        _require(len(path) >= 2, "UniswapV2Library: INVALID_PATH")
+        amounts = [0] * len(path)
+        amounts[-1] = amount_out
+        for i in range(len(path) - 1, 0, -1):
+            reserve_in, reserve_out = self._get_reserves(path[i - 1], path[i])
+            amounts[i - 1] = self.getAmountIn(msg, amounts[i], reserve_in, reserve_out)
+        return amounts
+
+    def addLiquidity(self, msg, token_a, token_b, amount_a_desired, amount_b_desired, amount_a_min, amount_b_min, to, deadline):
+        self._check_deadline(deadline)
+        factory = self.chain.contracts[self._factory]
+        if factory.getPair(msg, token_a, token_b) == ZERO_ADDRESS:
+            factory.createPair(msg, token_a, token_b)
+        reserve_a, reserve_b = self._get_reserves(token_a, token_b, allow_empty=True)
+        if reserve_a == 0 and reserve_b == 0:
+            amount_a, amount_b = amount_a_desired, amount_b_desired
+        else:
+            amount_b_optimal = self.quote(msg, amount_a_desired, reserve_a, reserve_b)
+            if amount_b_optimal <= amount_b_desired:
+                _require(amount_b_optimal >= amount_b_min, "UniswapV2Router: INSUFFICIENT_B_AMOUNT")
+                amount_a, amount_b = amount_a_desired, amount_b_optimal
+            else:
+                amount_a_optimal = self.quote(msg, amount_b_desired, reserve_b, reserve_a)
+                _require(amount_a_optimal <= amount_a_desired, "UniswapV2Router: INSUFFICIENT_A_AMOUNT")
+                _require(amount_a_optimal >= amount_a_min, "UniswapV2Router: INSUFFICIENT_A_AMOUNT")
+                amount_a, amount_b = amount_a_optimal, amount_b_desired
+        pair = self.chain.contracts[factory.getPair(msg, token_a, token_b)]
+        contract_a = self.chain.contracts[token_a]
+        contract_b = self.chain.contracts[token_b]
+        for contract, amount in ((contract_a, amount_a), (contract_b, amount_b)):
+            contract._check_allowance(msg.sender, self.address, amount)
+            contract._check_balance(msg.sender, amount)
+        contract_a.transferFrom(Msg(self.address), msg.sender, pair.address, amount_a)
+        contract_b.transferFrom(Msg(self.address), msg.sender, pair.address, amount_b)
+        liquidity = pair._mint_liquidity(to)
+        return amount_a, amount_b, liquidity
+
+    def removeLiquidity(self, msg, token_a, token_b, liquidity, amount_a_min, amount_b_min, to, deadline):
+        self._check_deadline(deadline)
+        pair_address = self.chain.contracts[self._factory].getPair(msg, token_a, token_b)
+        _require(pair_address != ZERO_ADDRESS, "UniswapV2Router: PAIR_DOES_NOT_EXIST")
+        pair = self.chain.contracts[pair_address]
+        pair._check_allowance(msg.sender, self.address, liquidity)
+        pair._check_balance(msg.sender, liquidity)
+        # amounts are checked against the minimums before anything moves.
+        token0, _ = _sort_tokens(token_a, token_b)
+        amount0 = liquidity * self.chain.contracts[pair._token0]._balances.get(pair_address, 0) // (pair._total_supply or 1)
+        amount1 = liquidity * self.chain.contracts[pair._token1]._balances.get(pair_address, 0) // (pair._total_supply or 1)
+        amount_a, amount_b = (amount0, amount1) if token_a == token0 else (amount1, amount0)
+        _require(amount_a >= amount_a_min, "UniswapV2Router: INSUFFICIENT_A_AMOUNT")
+        _require(amount_b >= amount_b_min, "UniswapV2Router: INSUFFICIENT_B_AMOUNT")
+        pair.transferFrom(Msg(self.address), msg.sender, pair_address, liquidity)
+        pair._burn_liquidity(to)
+        return amount_a, amount_b
+
+    def swapExactTokensForTokens(self, msg, amount_in, amount_out_min, path, to, deadline):
+        self._check_deadline(deadline)
+        amounts = self.getAmountsOut(msg, amount_in, path)
+        _require(amounts[-1] >= amount_out_min, "UniswapV2Router: INSUFFICIENT_OUTPUT_AMOUNT")
+        self._swap(msg.sender, amounts, path, to)
+        return amounts
+
+    def swapExactTokensForETH(self, msg, amount_in, amount_out_min, path, to, deadline):
+        self._check_deadline(deadline)
+        _require(path[-1] == self._weth, "UniswapV2Router: INVALID_PATH")
+        amounts = self.getAmountsOut(msg, amount_in, path)
+        _require(amounts[-1] >= amount_out_min, "UniswapV2Router: INSUFFICIENT_OUTPUT_AMOUNT")
+        self._swap(msg.sender, amounts, path, self.address)
+        # unwrap the weth and send the native coin on.
+        self.chain.contracts[self._weth]._burn(self.address, amounts[-1])
+        self.chain.native_balances[to] = self.chain.native_balances.get(to, 0) + amounts[-1]
+        return amounts
+
+    def _check_deadline(self, deadline):
+        _require(deadline >= int(time.time()), "UniswapV2Router: EXPIRED")
+
+    def _get_reserves(self, token_a, token_b, allow_empty=False):
+        pair_address = self.chain.contracts[self._factory].getPair(None, token_a, token_b)
+        if pair_address == ZERO_ADDRESS:
+            _require(allow_empty, "UniswapV2Library: PAIR_DOES_NOT_EXIST")
+            return 0, 0
+        pair = self.chain.contracts[pair_address]
+        if token_a == pair._token0:
+            return pair._reserve0, pair._reserve1
+        return pair._reserve1, pair._reserve0
+
+    def _swap(self, sender, amounts, path, to):
+        factory = self.chain.contracts[self._factory]
+        first = self.chain.contracts[path[0]]
+        first_pair = factory.getPair(None, path[0], path[1])
+        first._check_allowance(sender, self.address, amounts[0])
+        first._check_balance(sender, amounts[0])
+        first.transferFrom(Msg(self.address), sender, first_pair, amounts[0])
+        for i in range(len(path) - 1):
+            pair = self.chain.contracts[factory.getPair(None, path[i], path[i + 1])]
+            recipient = factory.getPair(None, path[i + 1], path[i + 2]) if i < len(path) - 2 else to
+            self.chain.contracts[path[i + 1]]._move(pair.address, recipient, amounts[i + 1])
+            pair._sync()
+
+
+class LocalChain():
+
+    def __init__(self, chain_id=1337, gas_price_gwei=1):
+        self.chain_id = chain_id
+        self.gas_price = Web3.toWei(gas_price_gwei, "gwei")
+        # tips eth_feeHistory reports, and the lowest gas price that gets mined (see congest()).
+        self.priority_fee = Web3.toWei(gas_price_gwei, "gwei")
+        self.min_gas_price = 0
+        # (sender, nonce) -> (gas price, hash) of transactions waiting for a higher price.
+        self.pending = {}
+        self.contracts = {}
+        self.native_balances = {}
+        self.nonces = {}
+        self.receipts = {}
+        self.block_number = 0
+        self._address_counter = itertools.count(1)
+        self.selectors = {
+            "erc20": _load_selectors(ERC20_ABI_FILE),
+            "pair": _load_selectors(PAIR_ABI_FILE),
+            "factory": _load_selectors(FACTORY_ABI_FILE),
+            "router": _load_selectors(ROUTER_ABI_FILE),
+        }
+
+    def congest(self, min_gas_price):
+        # transactions below min_gas_price (wei) wait unmined until they are replaced with a higher price.
+        self.min_gas_price = min_gas_price
+
+    def _new_address(self):
+        seed = b"localchain-%d" % next(self._address_counter)
+        return to_checksum("0x" + Web3.keccak(seed)[-20:].hex().replace("0x", ""))
+
+    ### DEPLOYMENT ###
+
+    def deploy_token(self, symbol, name=None, decimals=18):
+        address = self._new_address()
+        self.contracts[address] = Token(self, address, symbol, name or symbol, decimals)
+        return address
+
+    def deploy_uniswap(self, weth_symbol="WETH"):
+        # returns the (factory, router, weth) addresses.
+        weth = self.deploy_token(weth_symbol, name="Wrapped Ether")
+        factory = self._new_address()
+        self.contracts[factory] = Factory(self, factory)
+        router = self._new_address()
+        self.contracts[router] = Router(self, router, factory, weth)
+        return factory, router, weth
+
+    def mint(self, token_address, to, amount):
+        self.contracts[token_address]._mint(to_checksum(to), amount)
+
+    def set_native_balance(self, address, amount):
+        self.native_balances[to_checksum(address)] = amount
+
+    def add_liquidity(self, router_address, owner, token_a, token_b, amount_a, amount_b):
+        # seeds a pool without going through a signed transaction.
+        owner = to_checksum(owner)
+        for token in (token_a, token_b):
+            self.contracts[token].approve(Msg(owner), router_address, MAX_UINT256)
+        return self.contracts[router_address].addLiquidity(
+            Msg(owner), token_a, token_b, amount_a, amount_b, 0, 0, owner, int(time.time() + 60))
+
+    ### EXECUTION ###
+
+    def describe_call(self, to, data):
+        # returns the abi function name of an eth_call, or None.
+        contract = self.contracts.get(to)
+        if contract is None or len(data) < 4:
+            return None
+        entry = self.selectors[contract.kind].get(bytes(data[:4]))
+        return entry[0] if entry else None
+
+    def execute(self, sender, to, data, value=0):
+        contract = self.contracts.get(to)
+        _require(contract is not None, "no contract at %s" % to)
+        entry = self.selectors[contract.kind].get(bytes(data[:4]))
+        _require(entry is not None, "unknown function selector")
+        name, in_types, out_types = entry
+        method = getattr(contract, name, None)
+        _require(method is not None, "%s() is not supported by the local chain" % name)
+        args = [self._normalize(arg) for arg in abi_decode(in_types, bytes(data[4:]))]
+        result = method(Msg(sender, value), *args)
+        if len(out_types) == 0:
+            return b""
+        if len(out_types) == 1:
+            result = (result,)
+        return abi_encode(out_types, list(result))
+
+    def _normalize(self, value):
+        # eth_abi hands back lower case addresses, everything in here is checksummed.
+        if isinstance(value, str) and value.startswith("0x") and len(value) == 42:
+            return to_checksum(value)
+        if isinstance(value, (list, tuple)):
+            return [self._normalize(v) for v in value]
+        return value
+
+    def send_raw_transaction(self, raw):
+        raw = bytes(raw)
+        sender = Account.recover_transaction(raw)
+        if raw[0] <= 0x7f:
+            # typed transaction: chainId, nonce, maxPriorityFeePerGas, maxFeePerGas, gas, to, value, data, ...
+            fields = rlp.decode(raw[1:])
+            nonce, gas_price, gas, to, value, data = fields[1], fields[3], fields[4], fields[5], fields[6], fields[7]
+        else:
+            nonce, gas_price, gas, to, value, data = rlp.decode(raw)[:6]
+        nonce = int.from_bytes(nonce, "big")
+        expected = self.nonces.get(sender, 0)
+        if nonce < expected:
+            raise ValueError("nonce too low")
+        if nonce > expected:
+            raise ValueError("nonce too high")
+        txn_hash = Web3.keccak(raw)
+        gas_price_wei = int.from_bytes(gas_price, "big")
+        waiting = self.pending.get((sender, nonce))
+        if waiting is not None and waiting[1] == txn_hash:
+            raise ValueError("already known")
+        if waiting is not None and gas_price_wei * 10 < waiting[0] * 11:
+            raise ValueError("replacement transaction underpriced")
+        if gas_price_wei < self.min_gas_price:
+            self.pending[(sender, nonce)] = (gas_price_wei, txn_hash)
+            return txn_hash
+        self.pending.pop((sender, nonce), None)
+        status = 1
+        try:
+            self.execute(sender, to_checksum("0x" + to.hex()), data, int.from_bytes(value, "big"))
+        except Revert as e:
+            logging.debug('local chain revert: %s' % e)
+            status = 0
+        self.nonces[sender] = expected + 1
+        self.block_number += 1
+        self.receipts[bytes(txn_hash)] = {
+            "transactionHash": txn_hash.hex(),
+            "transactionIndex": "0x0",
+            "blockHash": Web3.keccak(b"block-%d" % self.block_number).hex(),
+            "blockNumber": hex(self.block_number),
+            "from": sender,
+            "to": to_checksum("0x" + to.hex()),
+            "cumulativeGasUsed": hex(DEFAULT_GAS),
+            "gasUsed": hex(DEFAULT_GAS),
+            "effectiveGasPrice": hex(int.from_bytes(gas_price, "big")),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": hex(status),
+            "type": "0x0",
+        }
+        return txn_hash
+
+
+class LocalChainProvider(BaseProvider):
+    """Serves a LocalChain over JSON-RPC and counts every request made against it."""
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.request_counts = Counter()
+        self.call_counts = Counter()
+        self._request_id = itertools.count(1)
+        # exceptions raised by the next requests, see inject_failures().
+        self.failures = []
+
+    def isConnected(self):
+        return True
+
+    def inject_failures(self, count, error=None):
+        # the next count requests raise error (a read timeout by default) instead of being answered.
+        for _ in range(count):
+            self.failures.append(error or Timeout("injected read timeout"))
+
+    def reset_counts(self):
+        self.request_counts = Counter()
+        self.call_counts = Counter()
+
+    def total_requests(self):
+        return sum(self.request_counts.values())
+
+    def make_request(self, method, params):
+        self.request_counts[method] += 1
+        request_id = next(self._request_id)
+        if self.failures:
+            raise self.failures.pop(0)
+        handler = getattr(self, "_rpc_%s" % method, None)
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": "method not found: %s" % method}}
+        try:
+            result = handler(*params)
+        except Revert as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": 3, "message": "execution reverted: %s" % e}}
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    ### JSON-RPC METHODS ###
+
+    def _rpc_eth_chainId(self):
+        return hex(self.chain.chain_id)
+
+    def _rpc_net_version(self):
+        return str(self.chain.chain_id)
+
+    def _rpc_eth_blockNumber(self):
+        return hex(self.chain.block_number)
+
+    def _rpc_eth_gasPrice(self):
+        return hex(self.chain.gas_price)
+
+    def _rpc_eth_getBalance(self, address, block="latest"):
+        return hex(self.chain.native_balances.get(to_checksum(address), 0))
+
+    def _rpc_eth_getTransactionCount(self, address, block="latest"):
+        return hex(self.chain.nonces.get(to_checksum(address), 0))
+
+    def _rpc_eth_getCode(self, address, block="latest"):
+        return "0x00" if to_checksum(address) in self.chain.contracts else "0x"
+
+    def _rpc_eth_estimateGas(self, txn, block="latest"):
+        return hex(DEFAULT_GAS)
+
+    def _rpc_eth_call(self, txn, block="latest"):
+        to = to_checksum(txn["to"])
+        data = bytes.fromhex(txn.get("data", "0x")[2:])
+        self.call_counts[self.chain.describe_call(to, data) or "unknown"] += 1
+        sender = to_checksum(txn["from"]) if txn.get("from") else ZERO_ADDRESS
+        return "0x" + self.chain.execute(sender, to, data).hex()
+
+    def _rpc_eth_sendRawTransaction(self, raw):
+        return self.chain.send_raw_transaction(bytes.fromhex(raw[2:])).hex()
+
+    def _rpc_eth_getTransactionReceipt(self, txn_hash):
+        return self.chain.receipts.get(bytes.fromhex(txn_hash[2:]))
+
+    def _rpc_eth_feeHistory(self, block_count, newest_block, percentiles=None):
+        block_count = int(block_count, 16) if isinstance(block_count, str) else block_count
+        newest = self.chain.block_number
+        count = min(block_count, newest + 1)
+        # higher percentiles tip more, the 50th pays the chain's priority fee.
+        rewards = [hex(self.chain.priority_fee * (50 + p) // 100) for p in (percentiles or [])]
+        return {
+            "oldestBlock": hex(newest - count + 1),
+            "baseFeePerGas": [hex(self.chain.gas_price)] * (count + 1),
+            "gasUsedRatio": [0.5] * count,
+            "reward": [list(rewards) for _ in range(count)],
+        }
+
+    def _rpc_eth_getBlockByNumber(self, block, full_transactions=False):
+        number = self.chain.block_number if block in ("latest", "pending") else int(block, 16)
+        return {
+            "number": hex(number),
+            "hash": Web3.keccak(b"block-%d" % number).hex(),
+            "parentHash": Web3.keccak(b"block-%d" % max(number - 1, 0)).hex(),
+            "timestamp": hex(int(time.time())),
+            "gasLimit": hex(30000000),
+            "gasUsed": hex(0),
+            "baseFeePerGas": hex(self.chain.gas_price),
+            "transactions": [],
+        }
@@ -0,0 +1,159 @@
+from uniswapv2 import UniswapV2
+from liquidity import create_stats_dict, run_cycle, set_cycle_block_number, load_pools_file, save_pools_file, USE_GAS_ORACLE, MAX_GAS_PRICE_GWEI
+from poolstate import PoolTable
+import logging
+import traceback
+import sys
+import os
+import time
+from settings import *
+
+try:
+    from settings import WALLETS
+except ImportError:
+    WALLETS = []
+if len(WALLETS) == 0:
+    WALLETS = [{"private_key": PRIVATE_KEY}]
+
+VERSION = "1.0"
+
+"""
+
+ Liquidity watcher for several wallets in one process.
+
+ Pool state (reserves, supply, token prices and metadata) is read once per cycle for every distinct pool,
+ no matter how many wallets hold it. Only the LP balanceOf reads are per wallet, and those are batched per
+ pool. Every wallet keeps its own thresholds, pools file and signing key, so removals stay separate.
+
+ Add the wallets to WALLETS in settings.py, if WALLETS is empty PRIVATE_KEY is watched on its own.
+
+"""
+
+# stats_dict settings a wallet entry in WALLETS can override.
+WALLET_OVERRIDES = [
+    "percent_up_remove_liquidity",
+    "percent_down_remove_liquidity",
+    "percent_report_change",
+    "value_token",
+]
+
+
+def main():
+    os.system("clear")
+
+    # Setup logger.
+    log_format = '%(asctime)s: %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_format, stream=sys.stdout)
+    logging.info('Uniswap Multi Wallet Liquidity Watcher v%s Started!' % VERSION)
+
+    watchers = create_watchers(WALLETS)
+    # the first wallet's client does all of the shared reads.
+    reader = watchers[0]["client"]
+    load_watcher_pools(reader, watchers)
+
+    while True:
+        watchers = run_watchers(reader, watchers)
+        time.sleep(CHECK_MINUTE_DELAY * 60)
+
+def create_watchers(wallets, provider=None):
+    watchers = []
+    for wallet in wallets:
+        client = UniswapV2(
+            wallet["private_key"],
+            txn_timeout=TXN_TIMEOUT,
+            gas_price_gwei=GAS_PRICE_IN_WEI,
+            rpc_host=RPC_HOST,
+            router_address=ROUTER_ADDRESS,
+            factory_address=FACTORY_ADDRESS,
+            block_explorer_prefix=BLOCK_EXPLORER_PREFIX,
+            provider=provider,
+            gas_oracle=USE_GAS_ORACLE,
+            max_gas_price_gwei=MAX_GAS_PRICE_GWEI
+        )
+        stats_dict = create_stats_dict({})
+        for name in WALLET_OVERRIDES:
+            if name in wallet:
+                stats_dict[name] = wallet[name]
+        watchers.append({"client": client, "stats_dict": stats_dict})
+    return share_pair_metadata(watchers)
+
+def share_pair_metadata(watchers):
+    # pair metadata never changes, all wallets share the first wallet's cache.
+    for watcher in watchers[1:]:
+        watcher["client"]._pair_metadata = watchers[0]["client"]._pair_metadata
+    return watchers
+
+def pools_filename(address):
+    return "pools_%s.csv" % address
+
+def load_watcher_pools(reader, watchers):
+    # wallets without a pools file share a single scan of the factory.
+    missing = []
+    for watcher in watchers:
+        address = watcher["client"].address
+        watcher["stats_dict"]["pool_table"] = PoolTable(load_pools_file(pools_filename(address)))
+        if len(watcher["stats_dict"]["pool_table"]) == 0:
+            missing.append(address)
+    if missing:
+        logging.info('No pools found for %s wallets. Searching for liquidity pools...' % len(missing))
+        deposited = reader._get_deposited_pairs_by_address(missing)
+        for watcher in watchers:
+            address = watcher["client"].address
+            for pair_address in deposited.get(address, []):
+                watcher["stats_dict"]["pool_table"].add(pair_address)
+    for watcher in watchers:
+        address = watcher["client"].address
+        logging.info('%s: watching %s pools.' % (address, len(watcher["stats_dict"]["pool_table"])))
+        save_pools_file(watcher["stats_dict"]["pool_table"].to_pools_dict(), pools_filename(address))
+
+def fetch_pools(reader, watchers):
+    # reads every distinct pool once into the first holder's table, copies the shared part into the other
+    # holders' tables and sets each wallet's LP balance. returns {address: set of pool ids read}.
+    holders = {}
+    for watcher in watchers:
+        value_token = watcher["stats_dict"]["value_token"]
+        table = watcher["stats_dict"]["pool_table"]
+        for pair_address in table.addresses():
+            holders.setdefault((pair_address, value_token), []).append((watcher["client"].address, table))
+    read_pools = dict((watcher["client"].address, set()) for watcher in watchers)
+    for (pair_address, value_token), tables in holders.items():
+        source = tables[0][1]
+        source_id = source.get(pair_address)
+        if not read_pool_state(reader, source, source_id, value_token):
+            continue
+        balances = reader._get_lp_balances(pair_address, [address for address, _ in tables], max_tries=RPC_ATTEMPTS,
+            block_identifier=source.read_block[source_id])
+        for address, table in tables:
+            if balances[address] is None:
+                continue
+            pool_id = table.get(pair_address)
+            if table is not source:
+                table.copy_shared(pool_id, source, source_id)
+            table.update_value(pool_id, balances[address] / 10 ** 18)
+            read_pools[address].add(pool_id)
+    return read_pools
+
+def read_pool_state(reader, table, pool_id, value_token):
+    try:
+        reader.read_policy.call(
+            lambda: reader._read_pool_state(table, pool_id, value_token=value_token),
+            max_tries=RPC_ATTEMPTS, description='pool %s' % table.address[pool_id])
+        return True
+    except:
+        logging.debug(traceback.format_exc())
+    return False
+
+def run_watchers(reader, watchers):
+    # one block number read tags the cycle of every wallet.
+    set_cycle_block_number(reader, watchers[0]["stats_dict"])
+    for watcher in watchers[1:]:
+        watcher["stats_dict"]["cycle_block_number"] = watchers[0]["stats_dict"]["cycle_block_number"]
+    read_pools = fetch_pools(reader, watchers)
+    for watcher in watchers:
+        address = watcher["client"].address
+        logging.info('Wallet %s:' % address)
+        watcher["stats_dict"] = run_cycle(watcher["client"], watcher["stats_dict"], read_pools=read_pools[address])
+    return watchers
+
+if __name__ == "__main__":
+    main()
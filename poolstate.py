@@ -0,0 +1,124 @@
+from array import array
+import math
+
+"""
+
+ Compact per-pool state for the liquidity watcher.
+
+ A PoolTable keeps one parallel array per field, indexed by pool id. Numbers are stored unboxed as
+ doubles (array "d"), so a pool costs a few bytes per field and no objects. process_pools() reads into
+ and compares against these rows in place, so a cycle does not build or replace any per-pool dicts.
+ Token names are not stored here, they are in the client's pair metadata cache.
+
+ A field that has not been read yet holds UNSET (NaN), check it with is_set(). read_block holds the block
+ number a row's reserves, supply and prices were read at, -1 before the first read.
+
+"""
+
+UNSET = float("nan")
+
+POOL_FIELDS = (
+    # reserves in whole tokens (decimals fixed) and the LP token total supply.
+    "reserve0",
+    "reserve1",
+    "total_supply",
+    # price of each token in the value token, 1.0 for the value token itself.
+    "token0_price",
+    "token1_price",
+    # LP tokens held.
+    "lp_balance",
+    # value in the value token: now, last cycle, last reported change and last removal check.
+    "value",
+    "previous_value",
+    "report_baseline",
+    "remove_baseline",
+)
+
+# fields that are the same for every wallet holding the pool.
+SHARED_FIELDS = POOL_FIELDS[:5]
+
+
+def is_set(number):
+    return not math.isnan(number)
+
+
+class PoolTable():
+
+    def __init__(self, addresses=()):
+        # pool id -> pair address, None once the pool is removed.
+        self.address = []
+        # pair address -> pool id.
+        self.index = {}
+        for name in POOL_FIELDS:
+            setattr(self, name, array("d"))
+        # block number of the last read of each row.
+        self.read_block = array("q")
+        # has the pool been logged since the last full report.
+        self.reported = bytearray()
+        # values saved in pools.csv are not used, a pool has no value until its first read.
+        for address in addresses:
+            self.add(address)
+
+    def add(self, address):
+        pool_id = self.index.get(address)
+        if pool_id is None:
+            pool_id = len(self.address)
+            self.address.append(address)
+            self.index[address] = pool_id
+            for name in POOL_FIELDS:
+                getattr(self, name).append(UNSET)
+            self.read_block.append(-1)
+            self.reported.append(0)
+        return pool_id
+
+    def get(self, address):
+        return self.index.get(address)
+
+    def remove(self, address):
+        # pool ids are never reused, removed rows are left in place.
+        pool_id = self.index.pop(address, None)
+        if pool_id is not None:
+            self.address[pool_id] = None
+        return pool_id
+
+    def __contains__(self, address):
+        return address in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def pool_ids(self):
+        # a copy, so pools can be removed while iterating.
+        return list(self.index.values())
+
+    def addresses(self):
+        return list(self.index)
+
+    def update_value(self, pool_id, lp_balance):
+        # LP balance and value of the pool from its last read reserves, supply and prices.
+        self.lp_balance[pool_id] = lp_balance
+        token0_amount, token1_amount = self.token_amounts(pool_id)
+        self.value[pool_id] = token0_amount * self.token0_price[pool_id] + token1_amount * self.token1_price[pool_id]
+
+    def token_amounts(self, pool_id):
+        # amount of each token the LP balance is worth.
+        share = self.lp_balance[pool_id] / self.total_supply[pool_id] if self.total_supply[pool_id] else 0.0
+        return share * self.reserve0[pool_id], share * self.reserve1[pool_id]
+
+    def copy_shared(self, pool_id, source, source_id):
+        # reserves, supply and prices read for another wallet's table.
+        for name in SHARED_FIELDS:
+            getattr(self, name)[pool_id] = getattr(source, name)[source_id]
+        self.read_block[pool_id] = source.read_block[source_id]
+
+    def reset_reported(self):
+        self.reported = bytearray(len(self.reported))
+
+    def reset_remove_baselines(self):
+        for pool_id in self.index.values():
+            self.remove_baseline[pool_id] = UNSET
+
+    def to_pools_dict(self):
+        # {address: value} in the format save_pools_file() writes.
+        return dict((address, self.value[pool_id] if is_set(self.value[pool_id]) else 0.0)
+            for address, pool_id in self.index.items())
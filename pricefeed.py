@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from requests.adapters import HTTPAdapter
+from retry import READ_POLICY
+import requests
+import threading
+import logging
+import traceback
+import json
+import time
+
+"""
+
+ Off-chain token price client for the PancakeSwap and Binance price APIs.
+
+ All requests share one keep-alive session. Every answer is cached per token/symbol for ttl seconds.
+ After that, and up to stale_ttl seconds, the cached answer is still returned at once while a
+ background thread fetches a fresh one (stale-while-revalidate). Many tokens are fetched concurrently,
+ Binance symbols in one request. Feed prices can be checked against the on-chain reserve price.
+
+ The base urls can be pointed at a local stub server for testing.
+
+"""
+
+PANCAKESWAP_API_URL = "https://api.pancakeswap.info/api/v2"
+BINANCE_API_URL = "https://api.binance.com/api/v3"
+
+
+class PriceFeedClient():
+
+    def __init__(self, pancakeswap_url=PANCAKESWAP_API_URL, binance_url=BINANCE_API_URL, ttl=60, stale_ttl=600,
+            timeout=10, max_workers=8, retry_policy=None):
+        self.pancakeswap_url = pancakeswap_url.rstrip("/")
+        self.binance_url = binance_url.rstrip("/")
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.retry_policy = retry_policy or READ_POLICY
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        # key -> (fetched at, response json)
+        self._cache = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    ### PANCAKESWAP ###
+
+    def pancakeswap_token(self, token_address, max_tries=None):
+        # response example: {"updated_at":1644451690368,"data":{"name":"USD Coin","symbol":"USDC","price":"0.999362623429255457703972330882","price_BNB":"0.002364980172183089994929542565945"}}
+        url = "%s/tokens/%s" % (self.pancakeswap_url, token_address)
+        return self._cached(("pancakeswap", token_address.lower()), lambda: self._get_json(url, max_tries=max_tries))
+
+    def get_token_price(self, token_address, max_tries=None):
+        # USD price as a Decimal, or None.
+        return self._pancakeswap_price(self.pancakeswap_token(token_address, max_tries=max_tries))
+
+    def get_token_prices(self, token_addresses, max_tries=None):
+        # {token address: USD price or None}, fetched concurrently.
+        token_addresses = list(token_addresses)
+        responses = self._executor.map(lambda token: self.pancakeswap_token(token, max_tries=max_tries), token_addresses)
+        return dict((token, self._pancakeswap_price(response)) for token, response in zip(token_addresses, responses))
+
+    ### BINANCE ###
+
+    def binance_ticker(self, symbol, max_tries=None):
+        # example symbol, BNBBUSD. response example: {"symbol":"BNBBUSD","price":"411.20000000"}
+        url = "%s/ticker/price" % self.binance_url
+        return self._cached(("binance", symbol.upper()),
+            lambda: self._get_json(url, params={"symbol": symbol.upper()}, max_tries=max_tries))
+
+    def get_symbol_price(self, symbol, max_tries=None):
+        return self._binance_price(self.binance_ticker(symbol, max_tries=max_tries))
+
+    def get_symbol_prices(self, symbols, max_tries=None):
+        # {symbol: price or None}. symbols missing from the cache are fetched in one request.
+        symbols = [symbol.upper() for symbol in symbols]
+        missing = [symbol for symbol in symbols if self._fresh(("binance", symbol)) is None]
+        if len(missing) > 1:
+            try:
+                tickers = self._get_json("%s/ticker/price" % self.binance_url,
+                    params={"symbols": json.dumps(missing, separators=(",", ":"))}, max_tries=max_tries)
+                now = time.time()
+                with self._lock:
+                    for ticker in tickers:
+                        self._cache[("binance", ticker["symbol"])] = (now, ticker)
+                    self.stats["refreshes"] += 1
+            except:
+                # fall back on one request per symbol.
+                logging.debug(traceback.format_exc())
+        return dict((symbol, self.get_symbol_price(symbol, max_tries=max_tries)) for symbol in symbols)
+
+    ### ON-CHAIN CROSS CHECK ###
+
+    def cross_check(self, client, token_address, value_token, max_deviation_percent=5):
+        # compares the feed's USD price with the mid price of the token's pair with value_token on client's
+        # chain (from the reserves, no swap fee or price impact), value_token should be a USD stablecoin.
+        # returns None when either price is missing.
+        feed_price = self.get_token_price(token_address)
+        if feed_price is None:
+            return None
+        onchain_price = client._get_mid_price(token_address, value_token)
+        if not onchain_price:
+            return None
+        deviation_percent = abs(feed_price - onchain_price) / onchain_price * 100
+        if deviation_percent > max_deviation_percent:
+            logging.info('WARNING: %s feed price %s is %s percent off the on-chain price %s.' % (
+                token_address, feed_price, round(deviation_percent, 2), onchain_price))
+        return {
+            "token": token_address,
+            "feed_price": feed_price,
+            "onchain_price": onchain_price,
+            "deviation_percent": deviation_percent,
+            "ok": deviation_percent <= max_deviation_percent,
+        }
+
+    ### PRIVATE METHODS ###
+
+    def _get_json(self, url, params=None, max_tries=None):
+
+        def fetch():
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return self.retry_policy.call(fetch, max_tries=max_tries, description=url)
+
+    def _fresh(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def _cached(self, key, fetch):
+        entry = self._cache.get(key)
+        age = time.time() - entry[0] if entry is not None else None
+        if entry is not None and age < self.ttl:
+            self._count("hits")
+            return entry[1]
+        if entry is not None and age < self.stale_ttl:
+            # serve the stale answer now, refresh it in the background.
+            self._count("stale_hits")
+            with self._lock:
+                refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if refresh:
+                self._executor.submit(self._refresh, key, fetch)
+            return entry[1]
+        self._count("misses")
+        return self._refresh(key, fetch, fallback=entry)
+
+    def _refresh(self, key, fetch, fallback=None):
+        try:
+            value = fetch()
+            with self._lock:
+                self._cache[key] = (time.time(), value)
+                self.stats["refreshes"] += 1
+            return value
+        except:
+            logging.info('Could not fetch price %s.' % str(key))
+            logging.debug(traceback.format_exc())
+            self._count("errors")
+            # a very old answer is better than none.
+            return fallback[1] if fallback is not None else None
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _pancakeswap_price(self, response):
+        try:
+            return Decimal(response["data"]["price"])
+        except:
+            return None
+
+    def _binance_price(self, response):
+        try:
+            return Decimal(response["price"])
+        except:
+            return None
+
+
+_price_feed = None
+_price_feed_lock = threading.Lock()
+
+
+def get_price_feed():
+    # the shared client used by the utils price helpers.
+    global _price_feed
+    with _price_feed_lock:
+        if _price_feed is None:
+            _price_feed = PriceFeedClient()
+        return _price_feed
+
+
+def set_price_feed(price_feed):
+    # e.g. a client pointed at other urls, or with other cache times.
+    global _price_feed
+    with _price_feed_lock:
+        _price_feed = price_feed
@@ -0,0 +1,199 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from decimal import Decimal
+from pricefeed import PriceFeedClient
+from retry import RetryPolicy
+import argparse
+import threading
+import logging
+import json
+import sys
+import time
+
+"""
+
+ Checks the price feed client (see pricefeed.py) against a local stub of the PancakeSwap and Binance APIs.
+
+ The stub is a http.server on a free local port, it counts every request and can be told to change its
+ prices or to answer with HTTP errors. Checked:
+   ttl               a second read within ttl is served from the cache, no request.
+   stale refresh     after ttl the cached price comes back at once and is refreshed in the background.
+   binance batch     several symbols missing from the cache are fetched in one symbols= request.
+   http errors       on a 500 the last answer is served, a price that was never fetched is None, and a
+                     failed Binance batch falls back on one request per symbol.
+
+ Usage:
+   python pricefeedcheck.py         # exits 1 if any check fails.
+   python pricefeedcheck.py -v      # also show the client's logs.
+
+"""
+
+TOKENS = ["0x%040x" % (i + 1) for i in range(4)]
+SYMBOLS = ["BNBBUSD", "ETHBUSD", "BTCBUSD"]
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        stub = self.server
+        with stub.lock:
+            stub.requests.append(self.path)
+            status, price = stub.status, stub.price
+        if status != 200:
+            body = {"error": "stub error"}
+        elif url.path.startswith("/pancakeswap/tokens/"):
+            body = {"updated_at": int(time.time() * 1000), "data": {"name": "Stub", "symbol": "STUB", "price": str(price)}}
+        elif url.path == "/binance/ticker/price" and "symbols" in query:
+            body = [{"symbol": symbol, "price": str(price)} for symbol in json.loads(query["symbols"][0])]
+        elif url.path == "/binance/ticker/price":
+            body = {"symbol": query["symbol"][0], "price": str(price)}
+        else:
+            status, body = 404, {"error": "not found"}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug('stub: ' + format % args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), StubRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.status = 200
+        self.price = 1
+        threading.Thread(target=self.serve_forever, name="price-stub", daemon=True).start()
+
+    def url(self, api):
+        return "http://127.0.0.1:%s/%s" % (self.server_address[1], api)
+
+    def set(self, status=None, price=None):
+        with self.lock:
+            if status is not None:
+                self.status = status
+            if price is not None:
+                self.price = price
+
+    def request_count(self):
+        with self.lock:
+            return len(self.requests)
+
+
+def create_client(stub, ttl, stale_ttl):
+    # one quick retry, so the error checks do not wait on the default backoff.
+    return PriceFeedClient(pancakeswap_url=stub.url("pancakeswap"), binance_url=stub.url("binance"), ttl=ttl,
+        stale_ttl=stale_ttl, timeout=5, retry_policy=RetryPolicy(max_tries=2, base_delay=0.01, max_delay=0.05))
+
+
+def wait_for(condition, timeout=2.0):
+    give_up_time = time.time() + timeout
+    while not condition() and time.time() < give_up_time:
+        time.sleep(0.01)
+    return condition()
+
+
+def check_ttl(stub):
+    client = create_client(stub, ttl=60, stale_ttl=600)
+    stub.set(status=200, price=1)
+    start = stub.request_count()
+    first = client.get_token_prices(TOKENS)
+    second = client.get_token_prices(TOKENS)
+    requests = stub.request_count() - start
+    client.close()
+    return requests == len(TOKENS) and first == second and client.stats["hits"] == len(TOKENS), \
+        "%s tokens read twice: %s requests, %s cache hits." % (len(TOKENS), requests, client.stats["hits"])
+
+
+def check_stale_refresh(stub):
+    client = create_client(stub, ttl=0.2, stale_ttl=60)
+    stub.set(status=200, price=1)
+    client.get_token_price(TOKENS[0])
+    stub.set(price=2)
+    time.sleep(0.3)
+    start = time.perf_counter()
+    stale = client.get_token_price(TOKENS[0])
+    stale_ms = (time.perf_counter() - start) * 1000
+    refreshed = wait_for(lambda: client._fresh(("pancakeswap", TOKENS[0])) is not None)
+    fresh = client.get_token_price(TOKENS[0])
+    client.close()
+    return stale == 1 and refreshed and fresh == 2 and client.stats["stale_hits"] == 1, \
+        "stale price %s served in %.2fms, refreshed in the background to %s." % (stale, stale_ms, fresh)
+
+
+def check_binance_batch(stub):
+    client = create_client(stub, ttl=60, stale_ttl=600)
+    stub.set(status=200, price=3)
+    start = stub.request_count()
+    prices = client.get_symbol_prices(SYMBOLS)
+    with stub.lock:
+        requests = stub.requests[start:]
+    client.close()
+    batched = len(requests) == 1 and "symbols=" in requests[0]
+    return batched and prices == dict((symbol, Decimal(3)) for symbol in SYMBOLS), \
+        "%s symbols in %s request(s): %s" % (len(SYMBOLS), len(requests), ", ".join(requests))
+
+
+def check_http_errors(stub):
+    client = create_client(stub, ttl=0.1, stale_ttl=0.2)
+    stub.set(status=200, price=4)
+    client.get_token_price(TOKENS[0])
+    stub.set(status=500)
+    time.sleep(0.3)
+    # past stale_ttl, so the client has to fetch, and falls back on the last answer.
+    old = client.get_token_price(TOKENS[0])
+    missing = client.get_token_price(TOKENS[1])
+    # the batch fails, then every symbol is tried on its own.
+    start = stub.request_count()
+    symbols = client.get_symbol_prices(SYMBOLS)
+    with stub.lock:
+        single = len([path for path in stub.requests[start:] if "symbol=" in path])
+    client.close()
+    ok = old == 4 and missing is None and all(price is None for price in symbols.values()) and single > 0
+    return ok, "on HTTP 500: last price %s served, never fetched price %s, %s single symbol fallback requests, %s errors." % (
+        old, missing, single, client.stats["errors"])
+
+
+CHECKS = [
+    ("ttl", check_ttl),
+    ("stale refresh", check_stale_refresh),
+    ("binance batch", check_binance_batch),
+    ("http errors", check_http_errors),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the price feed client against a local stub server.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the client logs.")
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s: %(message)s'
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format=log_format, stream=sys.stdout)
+
+    stub = StubServer()
+    failures = 0
+    try:
+        for name, check in CHECKS:
+            try:
+                ok, detail = check(stub)
+            except Exception as e:
+                ok, detail = False, "%s: %s" % (type(e).__name__, e)
+            failures += 0 if ok else 1
+            print("%-4s %-14s %s" % ("ok" if ok else "FAIL", name, detail))
+    finally:
+        stub.shutdown()
+    if failures > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from collections import Counter
+from poolstate import is_set
+import threading
+import logging
+import json
+import time
+import os
+
+"""
+
+ Read-only local API for the liquidity watcher's latest state.
+
+ After every cycle the watcher publishes a snapshot (pools, totals, token prices and cache stats) to a
+ SnapshotStore. The snapshot is tagged with the block number the cycle started at, and every pool and
+ price with read_block, the block its numbers were read at. A pool whose read failed this cycle keeps
+ the older read_block of its last successful read. The snapshot is serialized once when it
+ is published and never changed afterwards, a new cycle swaps in a new one. Readers only pick up the
+ current reference, so any number of them can be served at once, without locks and without RPC calls.
+
+ Endpoints (all GET, JSON):
+   /                  the whole snapshot.
+   /pools             every watched pool.
+   /pools/<address>   one pool.
+   /totals            total value, previous total value and pool count.
+   /prices            price of every pool token in the value token.
+   /prices/<address>  one token.
+   /stats             cache and server statistics.
+
+ Responses carry an ETag of the snapshot, send it back in If-None-Match to get a 304 until the next cycle.
+
+ Enable it with QUERY_SERVER_PORT and/or QUERY_SERVER_SOCKET in settings.py, e.g.
+   curl localhost:8545/totals
+   curl --unix-socket /tmp/liquidity.sock http://localhost/pools
+
+"""
+
+
+def to_json(value):
+    # Decimals are sent as strings so no precision is lost.
+    return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+
+class SnapshotStore():
+
+    def __init__(self):
+        self.sequence = 0
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        # (snapshot, {path: json bytes}, etag). replaced as a whole, never modified.
+        self._current = ({}, {}, None)
+
+    def publish(self, snapshot):
+        self.sequence += 1
+        snapshot = dict(snapshot)
+        snapshot["sequence"] = self.sequence
+        tags = {
+            "block_number": snapshot.get("block_number"),
+            "updated_at": snapshot.get("updated_at"),
+            "sequence": self.sequence,
+        }
+        responses = {"/": to_json(snapshot)}
+        responses["/pools"] = to_json(dict(tags, pools=snapshot["pools"]))
+        responses["/totals"] = to_json(dict(tags, value_token=snapshot["value_token"],
+            value_token_name=snapshot["value_token_name"], **snapshot["totals"]))
+        responses["/prices"] = to_json(dict(tags, value_token=snapshot["value_token"], prices=snapshot["prices"]))
+        for address, pool in snapshot["pools"].items():
+            responses["/pools/%s" % address.lower()] = to_json(dict(tags, **pool))
+        for address, price in snapshot["prices"].items():
+            responses["/prices/%s" % address.lower()] = to_json(dict(tags, **price))
+        etag = '"%s-%s"' % (snapshot.get("block_number"), self.sequence)
+        self._current = (snapshot, responses, etag)
+
+    def get(self, path):
+        # (json bytes or None, etag) from the current snapshot.
+        _, responses, etag = self._current
+        with self._lock:
+            self.requests[path.split("/")[1] or "/"] += 1
+        return responses.get(path), etag
+
+    def stats(self):
+        snapshot, _, _ = self._current
+        with self._lock:
+            self.requests["stats"] += 1
+            requests = dict(self.requests)
+        return {
+            "block_number": snapshot.get("block_number"),
+            "updated_at": snapshot.get("updated_at"),
+            "sequence": self.sequence,
+            "age_s": time.time() - snapshot["updated_at"] if snapshot else None,
+            "cache": snapshot.get("cache", {}),
+            "requests": requests,
+        }
+
+
+def create_snapshot(client, stats_dict, block_number=None):
+    # everything here was already read by the watcher's last cycle. block_number defaults to the block
+    # the cycle started at.
+    if block_number is None:
+        block_number = stats_dict.get("cycle_block_number")
+    table = stats_dict["pool_table"]
+    pools = {}
+    prices = {}
+    for pool_id in table.pool_ids():
+        address = table.address[pool_id]
+        metadata = client._pair_metadata.get(address)
+        if not is_set(table.value[pool_id]) or metadata is None:
+            continue
+        token0_amount, token1_amount = table.token_amounts(pool_id)
+        pools[address] = {
+            "address": address,
+            "read_block": table.read_block[pool_id],
+            "symbol": "%s<>%s" % (metadata["token0_name"], metadata["token1_name"]),
+            "token0_name": metadata["token0_name"],
+            "token1_name": metadata["token1_name"],
+            "reserves": [table.reserve0[pool_id], table.reserve1[pool_id]],
+            "lp_balance": table.lp_balance[pool_id],
+            "token0_amount": token0_amount,
+            "token1_amount": token1_amount,
+            "value": table.value[pool_id],
+            "previous_value": table.previous_value[pool_id] if is_set(table.previous_value[pool_id]) else None,
+        }
+        for token, price in (("token0", table.token0_price[pool_id]), ("token1", table.token1_price[pool_id])):
+            if str(metadata[token]) != str(stats_dict["value_token"]):
+                prices[metadata[token]] = {
+                    "address": metadata[token],
+                    "symbol": metadata[token + "_name"],
+                    "price": price,
+                    "pair": address,
+                    "read_block": table.read_block[pool_id],
+                }
+    return {
+        "block_number": block_number,
+        "updated_at": time.time(),
+        "value_token": stats_dict["value_token"],
+        "value_token_name": stats_dict["value_token_name"],
+        "totals": {
+            "current_total_value": stats_dict["current_total_value"],
+            "previous_total_value": stats_dict["previous_total_value"],
+            "pool_count": len(pools),
+        },
+        "pools": pools,
+        "prices": prices,
+        "cache": {
+            "pair_metadata": len(client._pair_metadata),
+            "pools": len(table),
+            "approved": len(client._approved),
+            "route_pairs": len(client.route_finder.pairs) if client.route_finder is not None else 0,
+            "gas_oracle": dict(client.gas_oracle.stats) if client.gas_oracle is not None else None,
+        },
+    }
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/").lower() or "/"
+        if self.server.store.sequence == 0:
+            self.send_json(503, to_json({"error": "no snapshot yet, the watcher has not finished a cycle."}))
+            return
+        if path == "/stats":
+            body, etag = to_json(self.server.store.stats()), None
+        else:
+            body, etag = self.server.store.get(path)
+        if body is None:
+            self.send_json(404, to_json({"error": "not found: %s" % path}))
+        elif etag is not None and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+        else:
+            self.send_json(200, body, etag=etag)
+
+    def send_json(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # unix socket clients have no address.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logging.debug('query server: ' + format % args)
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class QueryServer():
+
+    def __init__(self, store, port=None, host="127.0.0.1", unix_socket=None):
+        self.store = store
+        self.port = port
+        self.host = host
+        self.unix_socket = unix_socket
+        self.servers = []
+
+    def start(self):
+        if self.port is not None:
+            server = ThreadingHTTPServer((self.host, self.port), QueryRequestHandler)
+            server.daemon_threads = True
+            self._serve(server)
+            # port 0 picks a free port.
+            self.port = server.server_address[1]
+            logging.info('Query server listening on http://%s:%s/' % (self.host, self.port))
+        if self.unix_socket is not None:
+            if os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+            self._serve(ThreadingUnixHTTPServer(self.unix_socket, QueryRequestHandler))
+            logging.info('Query server listening on %s' % self.unix_socket)
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+        self.servers = []
+
+    def _serve(self, server):
+        server.store = self.store
+        threading.Thread(target=server.serve_forever, name="query-server", daemon=True).start()
+        self.servers.append(server)
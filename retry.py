@@ -0,0 +1,125 @@
+from requests.exceptions import Timeout, ConnectionError, HTTPError
+import socket
+import random
+import time
+import logging
+
+"""
+
+ Shared retry policy for RPC reads and transactions.
+
+ Errors are classified (timeout, connection, rate limit, revert, insufficient funds, nonce too low,
+ underpriced, already known) and retried with jittered exponential backoff until the attempts or the
+ operation's deadline run out. Reverts, and transactions the wallet can not pay for, can not succeed on
+ a retry, so they fail straight away.
+
+"""
+
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+RATE_LIMIT = "rate_limit"
+REVERT = "revert"
+INSUFFICIENT_FUNDS = "insufficient_funds"
+NONCE_TOO_LOW = "nonce_too_low"
+UNDERPRICED = "underpriced"
+# the node already has this exact transaction, e.g. from a send whose response was lost.
+ALREADY_KNOWN = "already_known"
+UNKNOWN = "unknown"
+
+# JSON-RPC "limit exceeded" (EIP-1474), sent by rate limited nodes. HTTP 429 is matched on the status code.
+LIMIT_EXCEEDED_CODE = -32005
+
+# matched against the lower cased error message, first match wins.
+ERROR_MESSAGES = [
+    (ALREADY_KNOWN, ["already known", "known transaction", "already imported"]),
+    (INSUFFICIENT_FUNDS, ["insufficient funds"]),
+    (NONCE_TOO_LOW, ["nonce too low", "nonce has already been used"]),
+    (UNDERPRICED, ["underpriced", "fee too low", "gas price too low", "max fee per gas less than block base fee"]),
+    (REVERT, ["execution reverted", "revert", "invalid opcode", "out of gas"]),
+    (RATE_LIMIT, ["rate limit", "too many requests"]),
+    (TIMEOUT, ["timeout", "timed out", "is not in the chain after"]),
+]
+
+
+def error_message(error):
+    # web3 raises ValueError({'code': ..., 'message': ...}) for JSON-RPC errors.
+    if error.args and isinstance(error.args[0], dict):
+        return str(error.args[0].get("message", error.args[0]))
+    return str(error)
+
+
+def classify_error(error):
+    if isinstance(error, HTTPError) and error.response is not None and error.response.status_code == 429:
+        return RATE_LIMIT
+    if isinstance(error, (Timeout, socket.timeout)) or type(error).__name__ == "TimeExhausted":
+        return TIMEOUT
+    if type(error).__name__ in ("ContractLogicError", "SolidityError"):
+        return REVERT
+    if error.args and isinstance(error.args[0], dict) and error.args[0].get("code") == LIMIT_EXCEEDED_CODE:
+        return RATE_LIMIT
+    message = error_message(error).lower()
+    for category, needles in ERROR_MESSAGES:
+        for needle in needles:
+            if needle in message:
+                return category
+    if isinstance(error, ConnectionError):
+        return CONNECTION
+    return UNKNOWN
+
+
+class RetryPolicy():
+
+    def __init__(self, max_tries=3, base_delay=0.2, max_delay=5.0, deadline=30.0, jitter=0.5,
+            rate_limit_factor=4, fail_fast=(REVERT,)):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.rate_limit_factor = rate_limit_factor
+        self.fail_fast = fail_fast
+
+    def delay(self, attempt, category):
+        # exponential backoff with jitter, rate limits back off harder. nonce errors retry straight away.
+        if category == NONCE_TOO_LOW:
+            return 0.0
+        delay = self.base_delay * (2 ** attempt)
+        if category == RATE_LIMIT:
+            delay *= self.rate_limit_factor
+        delay = min(delay, self.max_delay)
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+    def call(self, fn, max_tries=None, deadline=None, description=None, on_error=None):
+        # calls fn until it returns, re-raising the last error once out of attempts or time.
+        # on_error(error, category) runs before every retry, e.g. to bump gas on an underpriced error.
+        max_tries = max(1, max_tries or self.max_tries)
+        deadline = self.deadline if deadline is None else deadline
+        description = description or getattr(fn, "__name__", "call")
+        give_up_time = time.time() + deadline
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                category = classify_error(e)
+                attempt += 1
+                if category in self.fail_fast:
+                    logging.debug('%s failed (%s), not retrying: %s' % (description, category, error_message(e)))
+                    raise
+                if attempt >= max_tries:
+                    raise
+                delay = self.delay(attempt - 1, category)
+                if time.time() + delay > give_up_time:
+                    logging.debug('%s deadline of %ss reached.' % (description, deadline))
+                    raise
+                logging.debug('%s failed (%s), retry %s/%s in %.2fs: %s' % (
+                    description, category, attempt, max_tries - 1, delay, error_message(e)))
+                if on_error is not None:
+                    on_error(e, category)
+                time.sleep(delay)
+
+
+# reads are cheap to repeat, transactions wait longer between attempts.
+READ_POLICY = RetryPolicy(max_tries=3, base_delay=0.2, max_delay=5.0, deadline=30.0)
+TRANSACTION_POLICY = RetryPolicy(max_tries=3, base_delay=0.5, max_delay=10.0, deadline=300.0,
+    fail_fast=(REVERT, INSUFFICIENT_FUNDS))
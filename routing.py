@@ -0,0 +1,165 @@
+"""
+
+ In-memory token graph of a UniswapV2 factory's pairs, used to find multi-hop swap routes.
+
+ Every pair is an edge between its two tokens, weighted by its cached reserves. Routes of up to
+ max_hops pairs are found by relaxing the graph one hop at a time, keeping the best amount that
+ reaches each token, so a search touches every pair at most max_hops times and makes no RPC calls.
+ Reserves are updated in place as they are read, so the graph stays current without reloading.
+ The constant-product math is also used by UniswapV2.zap_in() to split a one-sided deposit.
+
+"""
+
+from math import isqrt
+
+FEE_NUMERATOR = 997
+FEE_DENOMINATOR = 1000
+
+
+def get_amount_out(amount_in, reserve_in, reserve_out, fee_numerator=FEE_NUMERATOR, fee_denominator=FEE_DENOMINATOR):
+    # same math as UniswapV2Library.getAmountOut().
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * fee_numerator
+    return amount_in_with_fee * reserve_out // (reserve_in * fee_denominator + amount_in_with_fee)
+
+
+def get_zap_swap_amount(amount_in, reserve_in, fee_numerator=FEE_NUMERATOR, fee_denominator=FEE_DENOMINATOR):
+    # how much of amount_in to swap so what is left and what the swap pays out match the pool's new ratio.
+    # the positive root of f*s^2 + r*(1+f)*s - a*r = 0, with f = fee_numerator / fee_denominator.
+    # for 0.3% fee pools that is (sqrt(r * (r * 3988009 + a * 3988000)) - r * 1997) / 1994.
+    if amount_in <= 0 or reserve_in <= 0:
+        return 0
+    n, d = fee_numerator, fee_denominator
+    return (isqrt(reserve_in * (reserve_in * (d + n) ** 2 + amount_in * 4 * n * d)) - reserve_in * (d + n)) // (2 * n)
+
+
+class RouteFinder():
+
+    def __init__(self, fee_numerator=FEE_NUMERATOR, fee_denominator=FEE_DENOMINATOR):
+        self.fee_numerator = fee_numerator
+        self.fee_denominator = fee_denominator
+        # pair_address -> [token0, token1, reserve0, reserve1]
+        self.pairs = {}
+        # token -> {neighbor token: pair_address}
+        self.graph = {}
+
+    def add_pair(self, pair_address, token0, token1, reserve0, reserve1):
+        self.pairs[pair_address] = [token0, token1, reserve0, reserve1]
+        self.graph.setdefault(token0, {})[token1] = pair_address
+        self.graph.setdefault(token1, {})[token0] = pair_address
+
+    def update_reserves(self, pair_address, reserve0, reserve1):
+        # returns False for pairs the graph does not know about.
+        pair = self.pairs.get(pair_address)
+        if pair is None:
+            return False
+        pair[2] = reserve0
+        pair[3] = reserve1
+        return True
+
+    def get_reserves(self, token_in, token_out):
+        pair_address = self.graph.get(token_in, {}).get(token_out)
+        if pair_address is None:
+            return None
+        token0, _, reserve0, reserve1 = self.pairs[pair_address]
+        if token_in == token0:
+            return reserve0, reserve1
+        return reserve1, reserve0
+
+    def get_amount_out(self, amount_in, reserve_in, reserve_out):
+        return get_amount_out(amount_in, reserve_in, reserve_out, self.fee_numerator, self.fee_denominator)
+
+    def get_amount_in(self, amount_out, reserve_in, reserve_out):
+        # same math as UniswapV2Library.getAmountIn(), None when the pool can not pay amount_out.
+        if amount_out <= 0 or reserve_in <= 0 or reserve_out <= amount_out:
+            return None
+        return reserve_in * amount_out * self.fee_denominator // ((reserve_out - amount_out) * self.fee_numerator) + 1
+
+    def find_route(self, token_in, token_out, amount_in, max_hops=3):
+        # best route selling exactly amount_in of token_in, or None.
+        if token_in == token_out or token_in not in self.graph:
+            return None
+        # token -> (amount that reaches it, path of tokens)
+        best = {token_in: (amount_in, [token_in])}
+        frontier = dict(best)
+        for _ in range(max_hops):
+            next_frontier = {}
+            for token, (amount, path) in frontier.items():
+                if token == token_out:
+                    continue
+                for neighbor in self.graph[token]:
+                    if neighbor in path:
+                        continue
+                    reserve_in, reserve_out = self.get_reserves(token, neighbor)
+                    amount_out = self.get_amount_out(amount, reserve_in, reserve_out)
+                    if amount_out <= 0:
+                        continue
+                    if neighbor not in best or amount_out > best[neighbor][0]:
+                        best[neighbor] = (amount_out, path + [neighbor])
+                        next_frontier[neighbor] = best[neighbor]
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        if token_out not in best:
+            return None
+        return self.describe_route(best[token_out][1], amount_in)
+
+    def find_route_exact_out(self, token_in, token_out, amount_out, max_hops=3):
+        # cheapest route buying exactly amount_out of token_out, or None. searches backwards from token_out.
+        if token_in == token_out or token_out not in self.graph:
+            return None
+        # token -> (amount of it needed, path of tokens ending in token_out)
+        best = {token_out: (amount_out, [token_out])}
+        frontier = dict(best)
+        for _ in range(max_hops):
+            next_frontier = {}
+            for token, (amount, path) in frontier.items():
+                if token == token_in:
+                    continue
+                for neighbor in self.graph[token]:
+                    if neighbor in path:
+                        continue
+                    reserve_in, reserve_out = self.get_reserves(neighbor, token)
+                    amount_needed = self.get_amount_in(amount, reserve_in, reserve_out)
+                    if amount_needed is None:
+                        continue
+                    if neighbor not in best or amount_needed < best[neighbor][0]:
+                        best[neighbor] = (amount_needed, [neighbor] + path)
+                        next_frontier[neighbor] = best[neighbor]
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        if token_in not in best:
+            return None
+        return self.describe_route(best[token_in][1], best[token_in][0])
+
+    def describe_route(self, path, amount_in):
+        # amounts, fee and price impact of every hop along path.
+        hops = []
+        amount = amount_in
+        for token, next_token in zip(path, path[1:]):
+            reserve_in, reserve_out = self.get_reserves(token, next_token)
+            amount_out = self.get_amount_out(amount, reserve_in, reserve_out)
+            # what amount would get at the pool's current price, after the fee.
+            ideal_out = amount * reserve_out * self.fee_numerator / (reserve_in * self.fee_denominator)
+            hops.append({
+                "pair": self.graph[token][next_token],
+                "token_in": token,
+                "token_out": next_token,
+                "amount_in": amount,
+                "amount_out": amount_out,
+                "fee": amount * (self.fee_denominator - self.fee_numerator) // self.fee_denominator,
+                "price_impact": 1 - amount_out / ideal_out if ideal_out else 0.0,
+            })
+            amount = amount_out
+        total_impact = 1.0
+        for hop in hops:
+            total_impact *= 1 - hop["price_impact"]
+        return {
+            "path": list(path),
+            "amount_in": amount_in,
+            "amount_out": amount,
+            "hops": hops,
+            "price_impact": 1 - total_impact,
+        }
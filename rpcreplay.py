@@ -0,0 +1,199 @@
+from web3 import Web3
+from web3.providers.base import BaseProvider
+from web3._utils.encoding import Web3JsonEncoder
+from collections import deque, Counter
+import argparse
+import gzip
+import json
+import logging
+import sys
+import time
+
+"""
+
+ Deterministic JSON-RPC record/replay for offline profiling.
+
+ RecordingProvider wraps any web3 provider and writes every request, response and latency of a
+ session to a gzipped json-lines file. ReplayProvider loads that file, indexes it by request, and
+ answers the same requests offline, either at full speed or with the recorded latencies, so
+ performance changes can be compared run-to-run on identical traffic.
+
+ Usage:
+   python rpcreplay.py record session.rpc.gz --cycles 3     # watch the pools in settings.py, recording.
+   python rpcreplay.py replay session.rpc.gz                # replay at full speed.
+   python rpcreplay.py replay session.rpc.gz --realtime     # replay with the original latencies.
+
+"""
+
+RECORD_FORMAT_VERSION = 1
+
+
+def request_key(method, params):
+    return "%s:%s" % (method, json.dumps(params, cls=Web3JsonEncoder, sort_keys=True, separators=(",", ":")))
+
+
+class RecordingProvider(BaseProvider):
+    """Passes every request to provider, and records it to filename."""
+
+    def __init__(self, provider, filename, header=None):
+        self.provider = provider
+        self.filename = filename
+        self.request_count = 0
+        self._started = time.perf_counter()
+        self._fp = gzip.open(filename, "wt")
+        header = dict(header or {})
+        header["version"] = RECORD_FORMAT_VERSION
+        header["recorded_at"] = time.time()
+        self._write(header)
+
+    def isConnected(self):
+        return self.provider.isConnected()
+
+    def make_request(self, method, params):
+        offset = time.perf_counter() - self._started
+        start = time.perf_counter()
+        response = self.provider.make_request(method, params)
+        latency = time.perf_counter() - start
+        self._write([self.request_count, round(offset, 6), round(latency, 6), method, params, response])
+        self.request_count += 1
+        return response
+
+    def write_footer(self, footer):
+        # anything the replay needs that was only known once the session finished.
+        self._write({"footer": footer})
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _write(self, record):
+        self._fp.write(json.dumps(record, cls=Web3JsonEncoder, separators=(",", ":")))
+        self._fp.write("\n")
+
+
+class ReplayProvider(BaseProvider):
+    """
+    Answers requests from a file written by RecordingProvider.
+
+    Requests are matched on method and params, in recorded order. Anything that can not match
+    exactly (signed transactions carry fresh deadlines, for example) falls back to the next unused
+    response for the same method.
+    """
+
+    def __init__(self, filename, realtime=False):
+        self.filename = filename
+        self.realtime = realtime
+        self.header = {}
+        self.footer = {}
+        self.records = []
+        self.stats = Counter()
+        self._by_key = {}
+        self._by_method = {}
+        self._used = set()
+        self.load()
+
+    def load(self):
+        with gzip.open(self.filename, "rt") as fp:
+            for line in fp:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    if "footer" in record:
+                        self.footer = record["footer"]
+                    else:
+                        self.header = record
+                    continue
+                index = len(self.records)
+                _, _, _, method, params, _ = record
+                self.records.append(record)
+                self._by_key.setdefault(request_key(method, params), deque()).append(index)
+                self._by_method.setdefault(method, deque()).append(index)
+        if self.header.get("version") != RECORD_FORMAT_VERSION:
+            raise Exception("%s is not a version %s rpc recording." % (self.filename, RECORD_FORMAT_VERSION))
+        logging.info('Loaded %s recorded requests from %s.' % (len(self.records), self.filename))
+
+    def isConnected(self):
+        return True
+
+    def make_request(self, method, params):
+        index = self._next(self._by_key.get(request_key(method, params)))
+        if index is not None:
+            self.stats["hits"] += 1
+        else:
+            index = self._next(self._by_method.get(method))
+            if index is None:
+                self.stats["misses"] += 1
+                return {"jsonrpc": "2.0", "id": 0, "error": {"code": -32000, "message": "no recorded response for %s" % method}}
+            self.stats["fallbacks"] += 1
+        self._used.add(index)
+        _, _, latency, _, _, response = self.records[index]
+        if self.realtime:
+            time.sleep(latency)
+        return response
+
+    def remaining(self):
+        return len(self.records) - len(self._used)
+
+    def _next(self, indexes):
+        # skip responses the other index already handed out.
+        while indexes:
+            index = indexes.popleft()
+            if index not in self._used:
+                return index
+        return None
+
+
+def record_session(filename, cycles):
+    import liquidity
+    recorder = RecordingProvider(Web3.HTTPProvider(liquidity.RPC_HOST), filename, header={"rpc_host": liquidity.RPC_HOST})
+    try:
+        client = liquidity.create_client(provider=recorder)
+        stats_dict = liquidity.create_stats_dict(liquidity.load_pools_dict(client))
+        pools = stats_dict["pool_table"].addresses()
+        for cycle in range(cycles):
+            start = time.perf_counter()
+            stats_dict = liquidity.run_cycle(client, stats_dict)
+            logging.info('Recorded cycle %s in %.3fs.' % (cycle + 1, time.perf_counter() - start))
+        recorder.write_footer({"cycles": cycles, "pools": pools})
+    finally:
+        recorder.close()
+    logging.info('Recorded %s requests to %s.' % (recorder.request_count, filename))
+
+
+def replay_session(filename, realtime=False):
+    import liquidity
+    replayer = ReplayProvider(filename, realtime=realtime)
+    if not replayer.footer:
+        raise Exception("%s has no footer, the recording did not finish." % filename)
+    client = liquidity.create_client(provider=replayer)
+    stats_dict = liquidity.create_stats_dict(dict((pool, 0.0) for pool in replayer.footer["pools"]))
+    timings = []
+    for cycle in range(replayer.footer["cycles"]):
+        start = time.perf_counter()
+        stats_dict = liquidity.run_cycle(client, stats_dict)
+        timings.append(time.perf_counter() - start)
+        logging.info('Replayed cycle %s in %.3fs.' % (cycle + 1, timings[-1]))
+    logging.info('Replay total: %.3fs. hits: %s. fallbacks: %s. misses: %s. unused: %s.' % (
+        sum(timings), replayer.stats["hits"], replayer.stats["fallbacks"], replayer.stats["misses"], replayer.remaining()))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay the liquidity watcher's RPC traffic.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("filename")
+    parser.add_argument("--cycles", type=int, default=1, help="process_pools cycles to record.")
+    parser.add_argument("--realtime", action="store_true", help="replay with the recorded latencies.")
+    args = parser.parse_args()
+
+    log_format = '%(asctime)s: %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_format, stream=sys.stdout)
+
+    if args.mode == "record":
+        record_session(args.filename, args.cycles)
+    else:
+        replay_session(args.filename, realtime=args.realtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+from uniswapv2 import UniswapV2
+from liquidity import create_stats_dict, run_cycle, load_pools_file, save_pools_file, USE_GAS_ORACLE, MAX_GAS_PRICE_GWEI
+from utils import decimal_round
+from decimal import Decimal
+from queue import Empty
+import multiprocessing
+import logging
+import traceback
+import sys
+import time
+from settings import *
+
+try:
+    from settings import CHAINS
+except ImportError:
+    CHAINS = []
+
+try:
+    from settings import REPORT_CURRENCY
+except ImportError:
+    REPORT_CURRENCY = None
+
+VERSION = "1.0"
+
+"""
+
+ Runs the liquidity watcher on several chains/routers at once, one worker process per chain.
+
+ Every worker keeps its own connection, pools file and stats, so one chain's I/O or CPU never holds
+ up another. Workers send their stats back after every cycle. When a worker crashes it is restarted
+ with the last stats it sent, so percent up/down baselines survive the restart. All chain totals are
+ converted to REPORT_CURRENCY and reported together.
+
+ Add the chains to CHAINS in settings.py, if CHAINS is empty the single chain settings are used.
+
+"""
+
+# seconds to wait before restarting a crashed worker. doubles on every crash in a row.
+WORKER_RESTART_DELAY = 10
+WORKER_RESTART_DELAY_MAX = 300
+
+
+def main():
+    log_format = '%(asctime)s: %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_format, stream=sys.stdout)
+    logging.info('Uniswap Liquidity Supervisor v%s Started!' % VERSION)
+
+    chains = CHAINS or [default_chain()]
+    queue = multiprocessing.Queue()
+    workers = {}
+    for chain in chains:
+        workers[chain["name"]] = {
+            "chain": chain,
+            "process": None,
+            "stats_dict": None,
+            "total": None,
+            "rate": None,
+            "crashes": 0,
+            "restart_time": 0,
+        }
+        start_worker(workers[chain["name"]], queue)
+
+    last_report_time = 0
+    while True:
+        received = drain_queue(workers, queue)
+        check_workers(workers, queue)
+        if received and time.time() - last_report_time > CHECK_MINUTE_DELAY * 60:
+            report_totals(workers)
+            last_report_time = time.time()
+
+def default_chain():
+    return {
+        "name": "default",
+        "rpc_host": RPC_HOST,
+        "router_address": ROUTER_ADDRESS,
+        "factory_address": FACTORY_ADDRESS,
+        "block_explorer_prefix": BLOCK_EXPLORER_PREFIX,
+        "value_token": VALUE_TOKEN,
+    }
+
+def chain_setting(chain, name, default):
+    return chain[name] if name in chain else default
+
+def start_worker(worker, queue):
+    chain = worker["chain"]
+    process = multiprocessing.Process(
+        target=run_worker, args=(chain, worker["stats_dict"], queue), name="watcher-%s" % chain["name"], daemon=True)
+    process.start()
+    worker["process"] = process
+    logging.info('Started %s worker (pid %s).' % (chain["name"], process.pid))
+
+def drain_queue(workers, queue):
+    # returns True when any worker sent new stats.
+    received = False
+    timeout = 5
+    while True:
+        try:
+            message = queue.get(timeout=timeout)
+        except Empty:
+            return received
+        worker = workers[message["chain"]]
+        worker["stats_dict"] = message["stats_dict"]
+        worker["total"] = message["total"]
+        worker["rate"] = message["rate"]
+        worker["crashes"] = 0
+        received = True
+        timeout = 0.1
+
+def check_workers(workers, queue):
+    for name, worker in workers.items():
+        process = worker["process"]
+        if process.is_alive():
+            continue
+        if worker["restart_time"] == 0:
+            delay = min(WORKER_RESTART_DELAY * (2 ** worker["crashes"]), WORKER_RESTART_DELAY_MAX)
+            worker["crashes"] += 1
+            worker["restart_time"] = time.time() + delay
+            logging.info('WARNING: %s worker exited with code %s. Restarting in %ss.' % (name, process.exitcode, delay))
+        elif time.time() >= worker["restart_time"]:
+            worker["restart_time"] = 0
+            start_worker(worker, queue)
+
+def report_totals(workers):
+    # every chain total in REPORT_CURRENCY. chains without a rate are reported on their own.
+    currency = REPORT_CURRENCY or "report currency"
+    grand_total = Decimal(0)
+    lines = []
+    for name, worker in workers.items():
+        if worker["total"] is None:
+            lines.append('%s: waiting for first cycle.' % name)
+            continue
+        value_token_name = worker["stats_dict"]["value_token_name"]
+        if worker["rate"] is None:
+            lines.append('%s: %s %s (no rate).' % (name, decimal_round(worker["total"], 8), value_token_name))
+            continue
+        converted = worker["total"] * worker["rate"]
+        grand_total += converted
+        lines.append('%s: %s %s = %s %s.' % (
+            name, decimal_round(worker["total"], 8), value_token_name, decimal_round(converted, 8), currency))
+    for line in lines:
+        logging.info(line)
+    logging.info("Total (in %s): %s" % (currency, str(decimal_round(grand_total, 8))))
+
+### WORKER PROCESS ###
+
+def run_worker(chain, stats_dict, queue):
+    name = chain["name"]
+    # workers log with their chain name so the merged output stays readable.
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    log_format = '%(asctime)s: [' + name + '] %(message)s'
+    logging.basicConfig(level=logging.INFO, format=log_format, stream=sys.stdout)
+    try:
+        client = UniswapV2(
+            chain_setting(chain, "private_key", PRIVATE_KEY),
+            txn_timeout=chain_setting(chain, "txn_timeout", TXN_TIMEOUT),
+            gas_price_gwei=chain_setting(chain, "gas_price_gwei", GAS_PRICE_IN_WEI),
+            rpc_host=chain["rpc_host"],
+            router_address=chain["router_address"],
+            factory_address=chain["factory_address"],
+            block_explorer_prefix=chain_setting(chain, "block_explorer_prefix", BLOCK_EXPLORER_PREFIX),
+            gas_oracle=chain_setting(chain, "use_gas_oracle", USE_GAS_ORACLE),
+            max_gas_price_gwei=chain_setting(chain, "max_gas_price_gwei", MAX_GAS_PRICE_GWEI)
+        )
+        if stats_dict is None:
+            stats_dict = create_worker_stats_dict(client, chain)
+        else:
+            logging.info('Restored stats for %s pools.' % len(stats_dict["pool_table"]))
+        while True:
+            stats_dict = run_cycle(client, stats_dict)
+            save_pools_file(stats_dict["pool_table"].to_pools_dict(), pools_filename(chain))
+            queue.put({
+                "chain": name,
+                "stats_dict": stats_dict,
+                "total": stats_dict["current_total_value"],
+                "rate": get_report_rate(client, chain, stats_dict["value_token"]),
+            })
+            time.sleep(chain_setting(chain, "check_minute_delay", CHECK_MINUTE_DELAY) * 60)
+    except:
+        logging.info(traceback.format_exc())
+        sys.exit(1)
+
+def pools_filename(chain):
+    return "pools_%s.csv" % chain["name"]
+
+def create_worker_stats_dict(client, chain):
+    pools_dict = load_pools_file(pools_filename(chain))
+    if len(pools_dict) == 0:
+        logging.info('No pools found. Searching for liquidity pools...')
+        for address in client._get_deposited_pairs():
+            pools_dict[address] = 0.0
+        logging.info('Found %s pools!' % len(pools_dict))
+    save_pools_file(pools_dict, pools_filename(chain))
+    stats_dict = create_stats_dict(pools_dict)
+    stats_dict["value_token"] = chain["value_token"]
+    for name in ["percent_up_remove_liquidity", "percent_down_remove_liquidity", "percent_report_change"]:
+        if name in chain:
+            stats_dict[name] = chain[name]
+    return stats_dict
+
+def get_report_rate(client, chain, value_token):
+    # price of one value token in the report currency, either fixed or read from a token on this chain.
+    if "report_rate" in chain:
+        return Decimal(str(chain["report_rate"]))
+    if "report_token" not in chain:
+        return None
+    try:
+        decimals = client._get_decimals(value_token)
+        price = client.get_token_price(10 ** decimals, value_token, value_token=chain["report_token"])
+        if price is not None:
+            return Decimal(str(price))
+    except:
+        logging.debug(traceback.format_exc())
+    return None
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,7 @@ def main():
         block_explorer_prefix=BLOCK_EXPLORER_PREFIX
     )
     
-    price = uniswap.get_price_for_amount(
+    price = uniswap.get_token_price(
         eth2wei(1), 
         "0x72Cb10C6bfA5624dD07Ef608027E366bd690048F",
     )
@@ -1,21 +1,36 @@
 from web3 import Web3
+from web3.middleware import simple_cache_middleware
+from web3.exceptions import TimeExhausted
 from decimal import Decimal
 from utils import wei2eth, eth2wei, to_checksum, read_json_file, decimal_fix_places, decimal_round
 import traceback
 import time
 import logging
 import random
+from concurrent.futures import ThreadPoolExecutor
+from routing import RouteFinder, get_amount_out, get_zap_swap_amount
+from retry import READ_POLICY, TRANSACTION_POLICY, UNDERPRICED, NONCE_TOO_LOW, ALREADY_KNOWN, classify_error, error_message
+from gasoracle import GasOracle
 
 ROUTER_ABI_FILE = "./abi/UniswapV2Router.json"
 PAIR_ABI_FILE = "./abi/UniswapV2Pair.json"
 FACTORY_ABI_FILE = "./abi/UniswapV2Factory.json"
 ERC20_ABI_FILE = "./abi/ERC20.json"
 
+# gas limits for pipelined transactions, sent before the one ahead of them is mined so they can not be estimated.
+SWAP_GAS_LIMIT = 300000
+ADD_LIQUIDITY_GAS_LIMIT = 400000
+
+# pool reads are pinned to a block number read at most this many seconds ago, so one eth_blockNumber serves
+# many pools and every row knows the block its numbers are from.
+BLOCK_NUMBER_MAX_AGE = 1.0
+
 class UniswapV2():
     def __init__(
         self, private_key, txn_timeout=60, gas_price_gwei=30, rpc_host="https://api.harmony.one/", slippage=10,
         router_address="0x24ad62502d1C652Cc7684081169D04896aC20f30", factory_address="0x9014B937069918bd319f80e8B3BB4A2cf6FAA5F7",
-        block_explorer_prefix="https://explorer.harmony.one/tx/"):
+        block_explorer_prefix="https://explorer.harmony.one/tx/", provider=None, read_workers=8,
+        read_policy=None, transaction_policy=None, gas_oracle=True, max_gas_price_gwei=None):
         self.private_key = private_key
         self.txn_timeout = txn_timeout
         self.gas_price = gas_price_gwei
@@ -24,8 +39,31 @@ class UniswapV2():
         self.router_address = router_address
         self.factory_address = factory_address
         self.block_explorer_prefix = block_explorer_prefix
+        self.read_workers = read_workers
+        # how failed rpc reads and transactions are retried, see retry.py.
+        self.read_policy = read_policy or READ_POLICY
+        self.transaction_policy = transaction_policy or TRANSACTION_POLICY
+        self._read_executor = None
+        self._pair_metadata = {}
+        # (time read, block number), see _get_block_number().
+        self._block_number = (0, None)
+        # contracts the router is approved to spend, so approve() only reads each allowance once.
+        self._approved = set()
+        # token graph for multi-hop swaps, loaded on first use (see load_route_graph()).
+        self.route_finder = None
         # Initialize web3, and load the smart contract objects.
-        self.w3 = Web3(Web3.HTTPProvider(self.rpc_host))
+        # A provider can be passed in to run against something other than rpc_host (local chain, replay, etc).
+        if provider is None:
+            provider = Web3.HTTPProvider(self.rpc_host)
+        self.w3 = Web3(provider)
+        # web3 checks the chain id on every call, cache it (and the other static lookups) after the first read.
+        self.w3.middleware_onion.add(simple_cache_middleware)
+        # prices transactions from recent fee history, gas_price_gwei is the fallback. see gasoracle.py.
+        self.gas_oracle = None
+        if gas_oracle:
+            self.gas_oracle = GasOracle(
+                self.w3, self.w3.toWei(self.gas_price, 'gwei'),
+                max_gas_price=self.w3.toWei(max_gas_price_gwei, 'gwei') if max_gas_price_gwei is not None else None)
         self.account = self.w3.eth.account.privateKeyToAccount(self.private_key)
         self.address = self.account.address
         self.w3.eth.default_account = self.address
@@ -46,60 +84,64 @@ class UniswapV2():
         nonce = self.w3.eth.getTransactionCount(self.address)
         return nonce
     
-    def approve(self, contract_address, type_="token", max_tries=1):
-        txn_receipt = None
+    def approve(self, contract_address, type_="token", max_tries=None, urgency="routine"):
         public_key = self.address
         contract_address = Web3.toChecksumAddress(contract_address)
+        if contract_address in self._approved:
+            return True
         if type_ == "pair":
             contract = self.w3.eth.contract(contract_address, abi=self.pair_abi)
         elif type_ == "token":
             contract = self.w3.eth.contract(contract_address, abi=self.erc20_abi)
         approved = False
-        try:
-            approved = contract.functions.allowance(public_key, self.router_address).call()
-            if int(approved) <= 500:
-                # we have not approved this token yet. approve!
-                for _ in range(max_tries):
-                    try:
-                        txn = contract.functions.approve(
-                            self.router_address,
-                            115792089237316195423570985008687907853269984665640564039457584007913129639935
-                        ).buildTransaction(
-                            {
-                                'from': public_key, 
-                                'gasPrice': self.w3.toWei(self.gas_price, 'gwei'),
-                                'nonce': self.get_nonce()
-                            }
-                        )
-                        signed_txn = self.w3.eth.account.sign_transaction(txn, self.private_key)
-                        txn = self.w3.eth.sendRawTransaction(signed_txn.rawTransaction)
-                        txn_receipt = self.w3.eth.waitForTransactionReceipt(txn)
-                        if txn_receipt and "status" in txn_receipt and txn_receipt["status"] == 1: 
-                            logging.info('Approved successfully!')
-                            approved = True
-                            break
-                    except:
-                        logging.debug(traceback.format_exc())
-            else:
-                logging.debug('Contract %s already approved.' % contract_address)
+        allowance = self._retry(
+            lambda: contract.functions.allowance(public_key, self.router_address).call(),
+            max_tries=max_tries, description='allowance of %s' % contract_address)
+        if allowance is not None and int(allowance) <= 500:
+            # we have not approved this token yet. approve!
+            txn_receipt = self._send_transaction(
+                contract.functions.approve(
+                    self.router_address,
+                    115792089237316195423570985008687907853269984665640564039457584007913129639935
+                ), max_tries=max_tries, urgency=urgency)
+            if txn_receipt and "status" in txn_receipt and txn_receipt["status"] == 1: 
+                logging.info('Approved successfully!')
                 approved = True
-        except:
-            logging.debug(traceback.format_exc())
+        elif allowance is not None:
+            logging.debug('Contract %s already approved.' % contract_address)
+            approved = True
         if approved is False:
             logging.debug('Could not approve contract: %s' % contract_address)
+        else:
+            self._approved.add(contract_address)
         return approved
 
-    def swap_tokens_for_eth(self, token_address, amount, max_tries=1):
+    def swap_tokens_for_eth(self, token_address, amount, max_tries=None, max_hops=1):
+        # max_hops above 1 lets the swap route through other pools when that pays out more.
         self.approve(token_address, max_tries=max_tries)
+        weth = self._weth()
+        if max_hops > 1:
+            route = self.find_route(token_address, weth, eth2wei(amount), max_hops=max_hops)
+            if route is None:
+                logging.info('No route from %s to %s.' % (token_address, weth))
+                return None
+            amounts = self._quote_route(route, max_tries=max_tries)
+            if amounts is None:
+                return None
+            path = route["path"]
+            amount_out_min = self._min_amount_out(amounts[-1])
+        else:
+            path = [token_address, weth]
+            amount_out_min = self._get_amounts_out(amount, path)[1]
         return self._swap_exact_tokens_for_eth(
             eth2wei(amount), 
-            self._get_amounts_out(amount, [token_address, self._weth()])[1], 
-            [token_address, self._weth()], 
+            amount_out_min, 
+            path, 
             self.address, 
-            int(time.time() + 60), 30, max_tries=max_tries
+            int(time.time() + 60), max_tries=max_tries
         )
 
-    def swap_all_tokens_for_tokens(self, from_token_address, to_token_address, max_tries=1):
+    def swap_all_tokens_for_tokens(self, from_token_address, to_token_address, max_tries=None, max_hops=1):
         # make sure the router is approved to manage this token...
         self.approve(from_token_address, max_tries=max_tries)
         # self.approve(to_token_address)
@@ -107,7 +149,22 @@ class UniswapV2():
         # get the total amount of from_token_address in wallet.
         amount_in = self._get_balance(account_address, from_token_address)
         result = None
-        if amount_in > 0.0:
+        if amount_in > 0.0 and max_hops > 1:
+            route = self.find_route(from_token_address, to_token_address, amount_in, max_hops=max_hops)
+            if route is None:
+                logging.info('No route from %s to %s.' % (from_token_address, to_token_address))
+                return None
+            amounts = self._quote_route(route, max_tries=max_tries)
+            if amounts is None:
+                return None
+            logging.info('Swap %s: %s for %s: %s through %s pools...' % (
+                from_token_address, amount_in, to_token_address, amounts[-1], len(route["hops"])))
+            result = self._swap_exact_tokens_for_tokens(
+                amount_in, self._min_amount_out(amounts[-1]), route["path"], 
+                account_address, int(time.time() + 60), max_tries=max_tries)
+            if result and "status" in result and result["status"] == 1:
+                logging.info('Successfully swapped!')
+        elif amount_in > 0.0:
             # Now that we have how much we have in our balance we have to let the router
             # adjust the amounts so that swap_exact_tokens_for_tokens() evaluates properly.
             amount_in, amount_out = self._get_amounts_out(amount_in, [from_token_address, to_token_address])
@@ -120,14 +177,14 @@ class UniswapV2():
             # now we can start this party...
             result = self._swap_exact_tokens_for_tokens(
                 amount_in, amount_out, [from_token_address, to_token_address], 
-                account_address, int(time.time() + 60), 30, max_tries=max_tries)
+                account_address, int(time.time() + 60), max_tries=max_tries)
             if result and "status" in result and result["status"] == 1:
                 logging.info('Successfully swapped!')
         else:
             logging.debug('WARNING: Not enough funds.')
         return result
     
-    def swap_tokens_for_single_token(self, from_token_address, to_token_address, max_tries=1):
+    def swap_tokens_for_single_token(self, from_token_address, to_token_address, max_tries=None):
         self.approve(from_token_address, max_tries=max_tries)
         # self.approve(to_token_address)
         account_address = self.address
@@ -138,12 +195,12 @@ class UniswapV2():
         logging.info('Swap %s: %s for %s: %s...' % (
             from_token_address, normalized_amount_in, to_token_address, normalized_amount_out))
         result = self._swap_exact_tokens_for_tokens(eth2wei(normalized_amount_in), eth2wei(normalized_amount_out), 
-            [from_token_address, to_token_address], account_address, int(time.time() + 60), 30, max_tries=max_tries)
+            [from_token_address, to_token_address], account_address, int(time.time() + 60), max_tries=max_tries)
         if result and "status" in result and result["status"] == 1:
             logging.info('Successfully swapped!')
         return result
         
-    def swap_tokens_for_tokens(self, from_token_address, to_token_address, x_amount, max_tries=1):
+    def swap_tokens_for_tokens(self, from_token_address, to_token_address, x_amount, max_tries=None, max_hops=1):
         # not finished.
         self.approve(from_token_address, max_tries=max_tries)
         # self.approve(to_token_address)
@@ -151,24 +208,40 @@ class UniswapV2():
         # get the total amount of X in wallet.
         balance = self._get_balance(account_address, from_token_address)
         result = None
-        if balance >= 1.0:
-            amount_out, amount_in = self._get_amounts_out(self.eth2wei(x_amount), [to_token_address, from_token_address])
+        if balance >= 1.0 and max_hops > 1:
+            route = self.find_route_exact_out(from_token_address, to_token_address, eth2wei(x_amount), max_hops=max_hops)
+            if route is None:
+                logging.info('No route from %s to %s.' % (from_token_address, to_token_address))
+                return None
+            amounts = self._quote_route(route, exact_out=True, max_tries=max_tries)
+            if amounts is None:
+                return None
+            logging.info('amount in: %s' % amounts[0])
+            logging.info('amount out: %s through %s pools' % (amounts[-1], len(route["hops"])))
+            result = self._swap_exact_tokens_for_tokens(
+                amounts[0], self._min_amount_out(amounts[-1]), route["path"], 
+                account_address, int(time.time() + 60), max_tries=max_tries)
+            if result and "status" in result and result["status"] == 1:
+                logging.info('Successfully swapped!')
+        elif balance >= 1.0:
+            amount_out, amount_in = self._get_amounts_out(eth2wei(x_amount), [to_token_address, from_token_address])
             amount_in = self._fix_decimal(amount_in, token_address=from_token_address)
             amount_out = self._fix_decimal(amount_out, token_address=to_token_address)
             logging.info('amount in: %s' % amount_in)
             logging.info('amount out: %s' % amount_out)
             result = self._swap_exact_tokens_for_tokens(
                 eth2wei(amount_in), eth2wei(x_amount), [from_token_address, to_token_address], 
-                account_address, int(time.time() + 60), 30, max_tries=max_tries)
+                account_address, int(time.time() + 60), max_tries=max_tries)
             if result and "status" in result and result["status"] == 1:
                 logging.info('Successfully swapped!')
         else:
             logging.info('not enough tokens to swap.')
         return result
     
-    def add_liquidity(self, tokenA, tokenB, amountA, amountB, txn_timeout, max_tries=1):
+    def add_liquidity(self, tokenA, tokenB, amountA, amountB, txn_timeout=None, max_tries=None):
+        # txn_timeout is not used, transactions wait self.txn_timeout.
         # make sure the router is approved to manage this token...
-        pool_address = self.pool_get_address(tokenA, tokenB)
+        pool_address = self._get_pair_address(tokenA, tokenB)
         
         # make sure that tokens and pool are allowed to spend funds.
         self.approve(tokenA, max_tries=max_tries)
@@ -176,7 +249,7 @@ class UniswapV2():
         self.approve(pool_address, type_="pair", max_tries=max_tries)
         
         deadline = int(time.time() + 60)
-        account_address = self._get_address()
+        account_address = self.address
         
         # get the total amount of from_token_address in wallet.
         tokenA_balance = self._get_balance(account_address, tokenA, max_tries=max_tries)
@@ -199,36 +272,87 @@ class UniswapV2():
             amountB, amountA_min = self._get_amounts_out(amountB, [tokenB, tokenA], max_tries=max_tries)
 
         results = self._add_liquidity(
-            tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, deadline, txn_timeout, max_tries=max_tries)
+            tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, deadline, max_tries=max_tries)
             
         if results and "status" in results and results["status"] == 1:
             logging.info("Successfully added liquidity to pool: %s!" % pool_address)
         
         return results
     
-    def remove_liquidity_from_pair(self, pair_address, max_tries=1):
-        tx_receipt = None
-        for _ in range(max_tries):
-            try:
-                # make sure that tokens and pool are allowed to spend funds.
-                pair_contract = self._get_pair_contract(pair_address)
-                tokenA = pair_contract.functions.token0().call()
-                tokenB = pair_contract.functions.token1().call()
-                # make sure that tokens and pool are allowed to spend funds.
-                self.approve(tokenA, max_tries=max_tries)
-                self.approve(tokenB, max_tries=max_tries)
-                self.approve(pair_address, type_="pair", max_tries=max_tries)
-                deadline = int(time.time() + 60)
-                liquidity = wei2eth(pair_contract.functions.balanceOf(self.address).call())
-            except:
-                logging.info(traceback.format_exc())
-                time.sleep(60)
-                continue
-            tx_receipt = self._remove_liquidity(
-                tokenA, tokenB, eth2wei(liquidity), 1, 1, deadline, max_tries=max_tries)
-            if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
-                logging.info('Removed liquidity successfully!')
-                break
+    def zap_in(self, pair_address, token_address, amount_in, max_tries=None, urgency="routine"):
+        # adds liquidity to pair_address with amount_in (wei) of one of its tokens. part of it is swapped
+        # for the other token, the split comes from one getReserves() read, then the swap and addLiquidity
+        # are sent back to back. the wallet must hold amount_in. returns the addLiquidity receipt.
+        metadata = self._get_pair_metadata(pair_address)
+        token_in = to_checksum(token_address)
+        if token_in == metadata["token0"]:
+            token_out = metadata["token1"]
+        elif token_in == metadata["token1"]:
+            token_out = metadata["token0"]
+        else:
+            raise Exception("%s is not a token of pair %s." % (token_address, pair_address))
+        
+        # both tokens go through the router, approvals are only sent the first time.
+        if not self.approve(token_in, max_tries=max_tries) or not self.approve(token_out, max_tries=max_tries):
+            return {"status": 0}
+        
+        pair_contract = self._get_pair_contract(pair_address)
+        reserves = self._retry(
+            pair_contract.functions.getReserves().call, max_tries=max_tries, description='reserves of %s' % pair_address)
+        if reserves is None:
+            return {"status": 0}
+        if token_in == metadata["token0"]:
+            reserve_in, reserve_out = reserves[0], reserves[1]
+        else:
+            reserve_in, reserve_out = reserves[1], reserves[0]
+        if self.route_finder is not None:
+            self.route_finder.update_reserves(pair_address, reserves[0], reserves[1])
+        
+        swap_amount = get_zap_swap_amount(amount_in, reserve_in)
+        amount_out = get_amount_out(swap_amount, reserve_in, reserve_out)
+        deposit_amount = amount_in - swap_amount
+        if swap_amount <= 0 or amount_out <= 0:
+            raise Exception("amount_in is too small to zap into %s." % pair_address)
+        logging.info('Zap %s into %s: swap %s for %s, deposit %s...' % (
+            amount_in, pair_address, swap_amount, amount_out, deposit_amount))
+        
+        deadline = int(time.time() + 60)
+        receipts = self._send_pipelined([
+            (self.router_contract.functions.swapExactTokensForTokens(
+                swap_amount, self._min_amount_out(amount_out), [token_in, token_out], self.address, deadline),
+                SWAP_GAS_LIMIT),
+            (self.router_contract.functions.addLiquidity(
+                token_in, token_out, deposit_amount, amount_out,
+                self._min_amount_out(deposit_amount), self._min_amount_out(amount_out), self.address, deadline),
+                ADD_LIQUIDITY_GAS_LIMIT),
+        ], urgency=urgency)
+        if receipts[0]["status"] == 1 and receipts[-1]["status"] != 1:
+            logging.info('WARNING: zap swap went through but adding liquidity did not.')
+        if receipts[-1]["status"] == 1:
+            logging.info("Successfully zapped into pool: %s!" % pair_address)
+        return receipts[-1]
+    
+    def remove_liquidity_from_pair(self, pair_address, max_tries=None, urgency="fast"):
+        # urgency prices the approvals and the removal, "emergency" pays the most to land first.
+        pair_contract = self._get_pair_contract(pair_address)
+        pair = self._retry(
+            lambda: (
+                pair_contract.functions.token0().call(),
+                pair_contract.functions.token1().call(),
+                pair_contract.functions.balanceOf(self.address).call()),
+            max_tries=max_tries, description='pair %s' % pair_address)
+        if pair is None:
+            return None
+        tokenA, tokenB, liquidity = pair
+        # make sure that tokens and pool are allowed to spend funds.
+        self.approve(tokenA, max_tries=max_tries, urgency=urgency)
+        self.approve(tokenB, max_tries=max_tries, urgency=urgency)
+        self.approve(pair_address, type_="pair", max_tries=max_tries, urgency=urgency)
+        deadline = int(time.time() + 60)
+        tx_receipt = self._remove_liquidity(
+            tokenA, tokenB, liquidity, 1, 1, deadline, max_tries=max_tries, urgency=urgency)
+        if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
+            logging.info('Removed liquidity successfully!')
         return tx_receipt
     
     def get_token_price(self, amount, token, value_token=None):
@@ -242,8 +366,107 @@ class UniswapV2():
             logging.debug(traceback.format_exc())
         return fixed_token_price
     
+    def load_route_graph(self, max_tries=None):
+        # reads every pair of the factory into the route graph (three reads per pair, on the read thread
+        # pool), later reserve reads keep it current. call it at start up, the first routed swap loads it
+        # otherwise. returns None when the factory's pair count can not be read.
+        pair_addresses = self._get_all_pairs(max_tries=max_tries)
+        if pair_addresses is None:
+            logging.info('Could not read the factory pairs, no route graph loaded.')
+            return None
+        route_finder = RouteFinder()
+        
+        def fetch(pair_address):
+            try:
+                pair_contract = self._get_pair_contract(pair_address)
+                if pair_address in self._pair_metadata:
+                    token0 = self._pair_metadata[pair_address]["token0"]
+                    token1 = self._pair_metadata[pair_address]["token1"]
+                else:
+                    token0 = pair_contract.functions.token0().call()
+                    token1 = pair_contract.functions.token1().call()
+                reserves = pair_contract.functions.getReserves().call()
+                return pair_address, token0, token1, reserves[0], reserves[1]
+            except:
+                logging.debug(traceback.format_exc())
+                return None
+        
+        for entry in self._read_many(fetch, pair_addresses):
+            if entry is not None:
+                route_finder.add_pair(*entry)
+        self.route_finder = route_finder
+        logging.info('Loaded %s pairs into the route graph.' % len(route_finder.pairs))
+        return route_finder
+    
+    def refresh_route_reserves(self, pair_addresses=None):
+        # re-reads the reserves of pair_addresses (default all pairs) into the route graph.
+        if self.route_finder is None:
+            return self.load_route_graph()
+        if pair_addresses is None:
+            pair_addresses = list(self.route_finder.pairs)
+        
+        def fetch(pair_address):
+            try:
+                return pair_address, self._get_pair_contract(pair_address).functions.getReserves().call()
+            except:
+                logging.debug(traceback.format_exc())
+                return pair_address, None
+        
+        for pair_address, reserves in self._read_many(fetch, pair_addresses):
+            if reserves is not None:
+                self.route_finder.update_reserves(pair_address, reserves[0], reserves[1])
+        return self.route_finder
+    
+    def find_route(self, from_token_address, to_token_address, amount_in, max_hops=3):
+        # best route for selling amount_in (wei) from cached reserves, see routing.py for the result.
+        # None when there is no route, or no route graph could be loaded.
+        if self._ensure_route_graph() is None:
+            return None
+        return self.route_finder.find_route(
+            to_checksum(from_token_address), to_checksum(to_token_address), amount_in, max_hops=max_hops)
+    
+    def find_route_exact_out(self, from_token_address, to_token_address, amount_out, max_hops=3):
+        # cheapest route for buying amount_out (wei) from cached reserves.
+        if self._ensure_route_graph() is None:
+            return None
+        return self.route_finder.find_route_exact_out(
+            to_checksum(from_token_address), to_checksum(to_token_address), amount_out, max_hops=max_hops)
+    
     ### PRIVATE METHODS ###
     
+    def _ensure_route_graph(self):
+        if self.route_finder is None:
+            logging.info('No route graph yet, reading every pair of the factory first. '
+                'Call load_route_graph() at start up to keep this out of the first routed swap.')
+            self.load_route_graph()
+        return self.route_finder
+    
+    def _quote_route(self, route, exact_out=False, max_tries=None):
+        # routes are searched on cached reserves. before trading on one, the router quotes its path at the
+        # current reserves (getAmountsOut, or getAmountsIn for exact-out), and the reserves of its pairs are
+        # re-read into the route graph. returns the router's amounts along route["path"], or None.
+        if exact_out:
+            amounts = self._get_amounts_in(route["amount_out"], route["path"], max_tries=max_tries)
+        else:
+            amounts = self._get_amounts_out(route["amount_in"], route["path"], max_tries=max_tries)
+        self.refresh_route_reserves([hop["pair"] for hop in route["hops"]])
+        if amounts is None:
+            logging.info('Could not quote route %s.' % " -> ".join(route["path"]))
+        return amounts
+    
+    def _min_amount_out(self, amount_out):
+        # leave room for the pools moving before the swap lands.
+        return amount_out * (100 - self.slippage) // 100
+    
+    def _read_many(self, fetch, items):
+        # runs fetch over items on the read thread pool, in order.
+        items = list(items)
+        if len(items) <= 1:
+            return [fetch(item) for item in items]
+        if self._read_executor is None:
+            self._read_executor = ThreadPoolExecutor(max_workers=self.read_workers)
+        return list(self._read_executor.map(fetch, items))
+    
     def _weth(self):
         return self.router_contract.functions.WETH().call()
     
@@ -258,7 +481,163 @@ class UniswapV2():
     def _link(self, txid):
         return '%s%s' % (self.block_explorer_prefix, str(txid))
     
-    def _add_liquidity(self, tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, deadline, max_tries=1):
+    def _retry(self, fn, max_tries=None, description=None):
+        # runs an rpc read under the read policy. None when every attempt failed.
+        try:
+            return self.read_policy.call(fn, max_tries=max_tries, description=description)
+        except Exception as e:
+            logging.info('Could not read %s (%s): %s' % (
+                description or getattr(fn, "__name__", "rpc"), classify_error(e), error_message(e)))
+            logging.debug(traceback.format_exc())
+            return None
+    
+    def _get_receipt(self, tx_hash):
+        # None while the transaction is not mined.
+        try:
+            return self.w3.eth.get_transaction_receipt(tx_hash)
+        except:
+            return None
+    
+    def _wait_for_receipt(self, tx_hashes):
+        # receipt of whichever of tx_hashes (replacements of one nonce) is mined first.
+        give_up_time = time.time() + self.txn_timeout
+        while True:
+            for tx_hash in tx_hashes:
+                tx_receipt = self._get_receipt(tx_hash)
+                if tx_receipt is not None:
+                    return tx_receipt
+            if time.time() >= give_up_time:
+                raise TimeExhausted("Transaction %s is not in the chain after %s seconds" % (
+                    tx_hashes[-1].hex(), self.txn_timeout))
+            time.sleep(3)
+    
+    def _get_gas_price(self, urgency="routine"):
+        # in wei.
+        if self.gas_oracle is not None:
+            return self.gas_oracle.gas_price(urgency)
+        return self.w3.toWei(self.gas_price, 'gwei')
+    
+    def _bump_gas_price(self, gas_price, urgency="routine"):
+        if self.gas_oracle is not None:
+            return self.gas_oracle.bump(gas_price, urgency)
+        return int(gas_price * 1.125) + 1
+    
+    def _send_transaction(self, contract_function, max_tries=None, urgency="routine"):
+        # builds, signs and sends contract_function under the transaction policy and waits for the receipt.
+        # a transaction that is not mined within txn_timeout is replaced (same nonce, higher gas price).
+        # a reverted receipt is returned as is, a transaction that never made it gives {"status": 0}.
+        # hashes of every transaction sent for this nonce, any of them can be the one that is mined.
+        sent = []
+        # signed: the transaction for the current nonce and gas price, broadcast: the node has it.
+        txn = {"nonce": None, "gasPrice": None, "signed": None, "broadcast": False}
+        
+        def send():
+            # an earlier attempt may have been mined after its wait timed out.
+            for tx_hash in sent:
+                tx_receipt = self._get_receipt(tx_hash)
+                if tx_receipt is not None:
+                    return tx_receipt
+            if txn["nonce"] is None:
+                txn["nonce"] = self.get_nonce()
+                txn["signed"] = None
+            if txn["gasPrice"] is None:
+                txn["gasPrice"] = self._get_gas_price(urgency)
+            if txn["signed"] is None:
+                tx = contract_function.buildTransaction({"nonce": txn["nonce"], "gasPrice": txn["gasPrice"]})
+                logging.debug("Signing transaction")
+                txn["signed"] = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
+                txn["broadcast"] = False
+                logging.debug("Sending transaction " + str(tx))
+            if not txn["broadcast"]:
+                # recorded before it is sent, the node can accept it even when the response is lost.
+                if txn["signed"].hash not in sent:
+                    sent.append(txn["signed"].hash)
+                try:
+                    self.w3.eth.send_raw_transaction(txn["signed"].rawTransaction)
+                except Exception as e:
+                    if classify_error(e) != ALREADY_KNOWN:
+                        raise
+                    # an earlier send of this same transaction reached the node.
+                    logging.debug("Transaction already known to the node.")
+                txn["broadcast"] = True
+                logging.debug("Transaction successfully sent !")
+                logging.info(
+                    "Waiting for confirmation: " + self._link(txn["signed"].hash.hex()))
+            return self._wait_for_receipt(sent)
+        
+        def on_error(error, category):
+            # only a node that turned the transaction down, or a wait that ran out, raises the gas price.
+            # other errors (transport errors on the send, failed reads while building) keep the price, and
+            # the next attempt resends the same signed transaction or builds it again.
+            rejected = category == UNDERPRICED and txn["signed"] is not None and not txn["broadcast"]
+            stuck = isinstance(error, TimeExhausted) and txn["broadcast"]
+            if rejected:
+                # it will never be mined.
+                sent.remove(txn["signed"].hash)
+            if rejected or stuck:
+                # replace it with a higher gas price.
+                gas_price = self._bump_gas_price(txn["gasPrice"], urgency)
+                if gas_price is not None:
+                    logging.info('Replacing %s transaction, gas price %s -> %s gwei.' % (
+                        contract_function.fn_name, self.w3.fromWei(txn["gasPrice"], 'gwei'), self.w3.fromWei(gas_price, 'gwei')))
+                    txn["gasPrice"] = gas_price
+                    txn["signed"] = None
+                elif sent:
+                    # at the max gas price, a replacement would be turned down. wait for the ones sent.
+                    logging.info('Gas price capped at %s gwei, waiting for the %s transaction.' % (
+                        self.w3.fromWei(txn["gasPrice"], 'gwei'), contract_function.fn_name))
+                    txn["broadcast"] = True
+            elif category == NONCE_TOO_LOW:
+                # mined, or the nonce was used by another transaction. send() checks ours first.
+                txn["nonce"] = None
+        
+        try:
+            tx_receipt = self.transaction_policy.call(
+                send, max_tries=max_tries, description=contract_function.fn_name, on_error=on_error)
+        except Exception as e:
+            logging.info('Transaction %s failed (%s): %s' % (contract_function.fn_name, classify_error(e), error_message(e)))
+            logging.debug(traceback.format_exc())
+            return {"status": 0}
+        if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
+            logging.info("Transaction confirmed !")
+        else:
+            logging.info("Transaction reverted: " + self._link(tx_receipt["transactionHash"].hex()))
+        return tx_receipt
+    
+    def _send_pipelined(self, transactions, urgency="routine"):
+        # sends [(contract_function, gas limit)] on consecutive nonces without waiting in between, then
+        # waits for every receipt. the gas limits skip estimateGas, which would fail on a transaction
+        # that depends on one that is not mined yet. returns a receipt (or {"status": 0}) per transaction.
+        receipts = [{"status": 0} for _ in transactions]
+        try:
+            nonce = self.get_nonce()
+            gas_price = self._get_gas_price(urgency)
+        except Exception as e:
+            logging.info('Could not prepare transactions (%s): %s' % (classify_error(e), error_message(e)))
+            return receipts
+        tx_hashes = []
+        for i, (contract_function, gas) in enumerate(transactions):
+            try:
+                tx = contract_function.buildTransaction({'gasPrice': gas_price, 'nonce': nonce + i, 'gas': gas})
+                signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
+                self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            except Exception as e:
+                # later transactions would wait on this nonce forever, so they are not sent.
+                logging.info('Transaction %s failed (%s): %s' % (contract_function.fn_name, classify_error(e), error_message(e)))
+                logging.debug(traceback.format_exc())
+                break
+            logging.info("Waiting for confirmation: " + self._link(signed_tx.hash.hex()))
+            tx_hashes.append(signed_tx.hash)
+        for i, tx_hash in enumerate(tx_hashes):
+            try:
+                receipts[i] = self.w3.eth.wait_for_transaction_receipt(
+                    transaction_hash=tx_hash, timeout=self.txn_timeout, poll_latency=3)
+            except Exception as e:
+                logging.info('Transaction %s not confirmed (%s): %s' % (
+                    transactions[i][0].fn_name, classify_error(e), error_message(e)))
+        return receipts
+    
+    def _add_liquidity(self, tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, deadline, max_tries=None, urgency="routine"):
         
         tokenA_symbol = self._get_symbol(tokenA)
         tokenB_symbol = self._get_symbol(tokenB)
@@ -269,154 +648,60 @@ class UniswapV2():
             tokenA_symbol, tokenB_symbol, fixed_amountA, fixed_amountB))
         
         # This was a bitch...
-        for _ in range(max_tries):
-            try:
-                tx = self.router_contract.functions.addLiquidity(
-                    tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, self.address, deadline).buildTransaction(
-                        {'gasPrice': self.w3.toWei(self.gas_price, 'gwei'), 'nonce': self.get_nonce()})
-                logging.debug("Signing transaction")
-                signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
-                logging.debug("Sending transaction: %s" % str(signed_tx))
-                ret = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-                logging.debug("Transaction successfully sent !")
-                logging.info(
-                    "Waiting for confirmation: " + self._link(signed_tx.hash.hex()))
-                tx_receipt = self.w3.eth.wait_for_transaction_receipt(
-                    transaction_hash=signed_tx.hash, timeout=self.txn_timeout, poll_latency=3)
-                if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
-                    logging.info("Transaction confirmed !")
-                    break
-            except:
-                logging.debug(traceback.format_exc())
-                tx_receipt = {"status": 0}
-                time.sleep(30)
-        return tx_receipt
+        return self._send_transaction(
+            self.router_contract.functions.addLiquidity(
+                tokenA, tokenB, amountA, amountB, amountA_min, amountB_min, self.address, deadline),
+            max_tries=max_tries, urgency=urgency)
 
-    def _remove_liquidity(self, tokenA, tokenB, liquidity, amountA_min, amountB_min, deadline, max_tries=1):
-        tx_receipt = None
-        for _ in range(max_tries):
-            token0_symbol = self._get_symbol(tokenA)
-            token1_symbol = self._get_symbol(tokenB)
-            logging.info('Removing %s LP from %s<>%s...' % (wei2eth(liquidity), token0_symbol, token1_symbol))
-            try:
-                tx = self.router_contract.functions.removeLiquidity(
-                    tokenA, tokenB, liquidity, amountA_min, amountB_min, self.address, deadline).buildTransaction(
-                        {'gasPrice': self.w3.toWei(self.gas_price, 'gwei'), 'nonce': self.get_nonce()})
-                logging.debug("Signing transaction")
-                signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
-                logging.debug("Sending transaction: %s" % str(signed_tx))
-                ret = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-                logging.debug("Transaction successfully sent !")
-                logging.info(
-                    "Waiting for confirmation: " + self._link(signed_tx.hash.hex()))
-                tx_receipt = self.w3.eth.wait_for_transaction_receipt(
-                    transaction_hash=signed_tx.hash, timeout=self.txn_timeout, poll_latency=3)
-                if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
-                    logging.info("Transaction confirmed !")
-                    break
-            except:
-                logging.info(traceback.format_exc())
-                tx_receipt = {"status": 0}
-        return tx_receipt
+    def _remove_liquidity(self, tokenA, tokenB, liquidity, amountA_min, amountB_min, deadline, max_tries=None, urgency="routine"):
+        token0_symbol = self._get_symbol(tokenA)
+        token1_symbol = self._get_symbol(tokenB)
+        logging.info('Removing %s LP from %s<>%s...' % (wei2eth(liquidity), token0_symbol, token1_symbol))
+        return self._send_transaction(
+            self.router_contract.functions.removeLiquidity(
+                tokenA, tokenB, liquidity, amountA_min, amountB_min, self.address, deadline),
+            max_tries=max_tries, urgency=urgency)
 
-    def _get_amount_in(self, amount_out, reserve_in, reserve_out, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.router_contract.functions.getAmountIn(
-                    amount_out, reserve_in, reserve_out).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-                response = None
-        return response
+    def _get_amount_in(self, amount_out, reserve_in, reserve_out, max_tries=None):
+        return self._retry(
+            lambda: self.router_contract.functions.getAmountIn(amount_out, reserve_in, reserve_out).call(),
+            max_tries=max_tries, description='getAmountIn')
     
-    def _get_amount_out(self, amount_in, reserve_in, reserve_out, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.router_contract.functions.getAmountOut(
-                    amount_in, reserve_in, reserve_out).call()
-                if response is not None:
-                    break
-            except:
-                response = None
-                logging.info(traceback.format_exc())
-        return response
+    def _get_amount_out(self, amount_in, reserve_in, reserve_out, max_tries=None):
+        return self._retry(
+            lambda: self.router_contract.functions.getAmountOut(amount_in, reserve_in, reserve_out).call(),
+            max_tries=max_tries, description='getAmountOut')
     
-    def _get_amounts_in(self, amount_out, path, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.router_contract.functions.getAmountsIn(
-                    amount_out, path).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_amounts_in(self, amount_out, path, max_tries=None):
+        return self._retry(
+            lambda: self.router_contract.functions.getAmountsIn(amount_out, path).call(),
+            max_tries=max_tries, description='getAmountsIn')
     
-    def _get_amounts_out(self, amount_in, path, max_tries=1):
+    def _get_amounts_out(self, amount_in, path, max_tries=None):
         # this is where we need to handle slippage
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.router_contract.functions.getAmountsOut(
-                    amount_in,
-                    path
-                ).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+        return self._retry(
+            lambda: self.router_contract.functions.getAmountsOut(amount_in, path).call(),
+            max_tries=max_tries, description='getAmountsOut')
     
-    def _get_symbol(self, token_address, max_tries=1):
-        contract = self.w3.eth.contract(Web3.toChecksumAddress(token_address), abi=self.erc20_abi)
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = contract.functions.symbol().call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_symbol(self, token_address, max_tries=None):
+        contract = self._get_token_contract(token_address)
+        return self._retry(
+            contract.functions.symbol().call, max_tries=max_tries, description='symbol of %s' % token_address)
     
-    def _get_name(self, token_address, max_tries=1):
-        contract = self.w3.eth.contract(Web3.toChecksumAddress(token_address), abi=self.erc20_abi)
-        for _ in range(max_tries):
-            try:
-                response = contract.functions.name().call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_name(self, token_address, max_tries=None):
+        contract = self._get_token_contract(token_address)
+        return self._retry(
+            contract.functions.name().call, max_tries=max_tries, description='name of %s' % token_address)
     
-    def _get_decimals(self, token_address, max_tries=1):
-        contract = self.w3.eth.contract(Web3.toChecksumAddress(token_address), abi=self.erc20_abi)
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = contract.functions.decimals().call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
+    def _get_decimals(self, token_address, max_tries=None):
+        contract = self._get_token_contract(token_address)
+        return self._retry(
+            contract.functions.decimals().call, max_tries=max_tries, description='decimals of %s' % token_address)
     
-    def _get_balance(self, address, token_address, max_tries=1):
-        contract = self.w3.eth.contract(Web3.toChecksumAddress(token_address), abi=self.erc20_abi)
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = contract.functions.balanceOf(address).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_balance(self, address, token_address, max_tries=None):
+        contract = self._get_token_contract(token_address)
+        return self._retry(
+            contract.functions.balanceOf(address).call, max_tries=max_tries, description='balance of %s' % token_address)
     
     def _get_token_contract(self, token_address):
         return self.w3.eth.contract(Web3.toChecksumAddress(token_address), abi=self.erc20_abi)
@@ -428,175 +713,234 @@ class UniswapV2():
     def _weth(self):
         return self.router_contract.functions.WETH().call()
     
-    def _quote(self, amount_a, reserve_a, reserve_b, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.router_contract.functions.quote(amount_a, reserve_a, reserve_b).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _quote(self, amount_a, reserve_a, reserve_b, max_tries=None):
+        return self._retry(
+            lambda: self.router_contract.functions.quote(amount_a, reserve_a, reserve_b).call(),
+            max_tries=max_tries, description='quote')
     
-    def _swap_exact_tokens_for_tokens(self, amount_in, amount_out_min, path, to, deadline, max_tries=1):
-        tx_receipt = None
-        for _ in range(max_tries):
-            try:
-                tx = self.router_contract.functions.swapExactTokensForTokens(
-                    amount_in, amount_out_min, path, to, deadline).buildTransaction(
-                    {'gasPrice': self.w3.toWei(self.gas_price, 'gwei'), 
-                    'nonce': self.get_nonce()})
-                logging.debug("Signing transaction")
-                signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
-                logging.debug("Sending transaction " + str(tx))
-                ret = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-                logging.debug("Transaction successfully sent !")
-                logging.info(
-                    "Waiting for confirmation: " + self._link(signed_tx.hash.hex()))
-                tx_receipt = self.w3.eth.wait_for_transaction_receipt(
-                    transaction_hash=signed_tx.hash, timeout=self.txn_timeout, poll_latency=3)
-                if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
-                    logging.info("Transaction confirmed !")
-                    break
-                else:
-                    logging.info('Could not perform swap.')
-                    time.sleep(60)
-            except:
-                logging.debug(traceback.format_exc())
+    def _swap_exact_tokens_for_tokens(self, amount_in, amount_out_min, path, to, deadline, max_tries=None, urgency="routine"):
+        tx_receipt = self._send_transaction(
+            self.router_contract.functions.swapExactTokensForTokens(amount_in, amount_out_min, path, to, deadline),
+            max_tries=max_tries, urgency=urgency)
+        if tx_receipt["status"] != 1:
+            logging.info('Could not perform swap.')
         return tx_receipt
     
-    def _swap_exact_tokens_for_eth(self, amount_in, amount_out_min, path, to, deadline, max_tries=1):
-        for _ in range(max_tries):
-            try:
-                tx = self.router_contract.functions.swapExactTokensForETH(amount_in, amount_out_min, path, to, deadline).buildTransaction(
-                    {'gasPrice': self.w3.toWei(self.gas_price, 'gwei'), 'nonce': self.get_nonce()})
-                logging.debug("Signing transaction")
-                signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.private_key)
-                logging.debug("Sending transaction " + str(tx))
-                ret = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-                logging.debug("Transaction successfully sent !")
-                logging.info(
-                    "Waiting for confirmation: " + self._link(signed_tx.hash.hex()))
-                tx_receipt = self.w3.eth.wait_for_transaction_receipt(
-                    transaction_hash=signed_tx.hash, timeout=self.txn_timeout, poll_latency=3)
-                if tx_receipt and "status" in tx_receipt and tx_receipt["status"] == 1:
-                    logging.info("Transaction confirmed !")
-                    break
-            except:
-                logging.debug(traceback.format_exc())
-        return tx_receipt
+    def _swap_exact_tokens_for_eth(self, amount_in, amount_out_min, path, to, deadline, max_tries=None, urgency="routine"):
+        return self._send_transaction(
+            self.router_contract.functions.swapExactTokensForETH(amount_in, amount_out_min, path, to, deadline),
+            max_tries=max_tries, urgency=urgency)
     
     def _get_pair_address(self, token_address_1, token_address_2):
         return self.factory_contract.functions.getPair(
             to_checksum(token_address_1), to_checksum(token_address_2)).call()
     
-    def _get_pair_length(self, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.factory_contract.functions.allPairsLength().call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_pair_length(self, max_tries=None):
+        return self._retry(
+            self.factory_contract.functions.allPairsLength().call, max_tries=max_tries, description='allPairsLength')
     
-    def _get_pair_index(self, index, max_tries=1):
-        response = None
-        for _ in range(max_tries):
-            try:
-                response = self.factory_contract.functions.allPairs(index).call()
-                if response is not None:
-                    break
-            except:
-                logging.info(traceback.format_exc())
-        return response
+    def _get_pair_index(self, index, max_tries=None):
+        return self._retry(
+            self.factory_contract.functions.allPairs(index).call, max_tries=max_tries, description='allPairs(%s)' % index)
     
-    def _get_all_pairs(self, max_tries=1):
-        pairs = []
-        for i in range(self._get_pair_length(max_tries=max_tries)):
-            result = self._get_pair_index(i, max_tries=max_tries)
-            if result is not None:
-                pairs.append(result)
-        return pairs
+    def _get_all_pairs(self, max_tries=None):
+        # every pair address of the factory, read on the read thread pool. None when the count can not be read.
+        pair_length = self._get_pair_length(max_tries=max_tries)
+        if pair_length is None:
+            return None
+        pairs = self._read_many(lambda i: self._get_pair_index(i, max_tries=max_tries), range(pair_length))
+        return [pair_address for pair_address in pairs if pair_address is not None]
+    
+    def _get_deposited_pairs(self, max_tries=None):
+        return self._get_deposited_pairs_by_address([self.address], max_tries=max_tries)[self.address]
     
-    def _get_deposited_pairs(self, max_tries=1):
-        pairs = []
+    def _get_deposited_pairs_by_address(self, addresses, max_tries=None):
+        # one scan of the factory for any number of wallets, LP balances are read in a batch per pair.
+        pairs = dict((address, []) for address in addresses)
         logging.info('Looking for deposited liquidity pools...')
         for i in range(self._get_pair_length(max_tries=max_tries)):
             pair_address = self._get_pair_index(i, max_tries=max_tries)
-            pair_contract = self._get_pair_contract(pair_address)
-            lp_balance = wei2eth(pair_contract.functions.balanceOf(self.address).call())
-            if lp_balance > 0.0:
-                logging.info('Found %s with %s LP tokens!' % (pair_address, lp_balance))
-                pairs.append(self._get_pair_index(i, max_tries=max_tries))
+            if pair_address is None:
+                continue
+            balances = self._get_lp_balances(pair_address, addresses, max_tries=max_tries)
+            for address in addresses:
+                if balances[address] is None:
+                    continue
+                lp_balance = wei2eth(balances[address])
+                if lp_balance > 0.0:
+                    logging.info('Found %s with %s LP tokens!' % (pair_address, lp_balance))
+                    pairs[address].append(pair_address)
         return pairs
     
-    def _get_pool_info(self, pair_address, value_token=None, max_tries=3):
-        result = {}
-        for _ in range(max_tries):
-            try:
-                if value_token is None:
-                    value_token = self._weth()
-                pair_contract = self._get_pair_contract(pair_address)
-                reserves = pair_contract.functions.getReserves().call()
-                pair_balance = pair_contract.functions.balanceOf(self.address).call()
-                total_supply = pair_contract.functions.totalSupply().call()
-                token0 = pair_contract.functions.token0().call()
-                token1 = pair_contract.functions.token1().call()
-                token0_contract = self._get_token_contract(token0)
-                token1_contract = self._get_token_contract(token1)
-                token0_decimals = token0_contract.functions.decimals().call()
-                token1_decimals = token1_contract.functions.decimals().call()
-                token0_name = token0_contract.functions.symbol().call()
-                token1_name = token1_contract.functions.symbol().call()
-                
-                # fix the decimals to the correct places.
-                # DO NOT USE fromWei()!
-                reserves[0] = self._fix_decimal(reserves[0], decimals=token0_decimals)
-                reserves[1] = self._fix_decimal(reserves[1], decimals=token1_decimals)
-                
-                total_supply = Web3.fromWei(total_supply, "ether")
-                pair_balance = Web3.fromWei(pair_balance, "ether")
-                
-                # Find the amount for both sides of the pair.
-                token0_pool_amount = Decimal(pair_balance) / (Decimal(total_supply) / Decimal(reserves[0]))
-                token1_pool_amount = Decimal(pair_balance) / (Decimal(total_supply) / Decimal(reserves[1]))
-                
-                logging.debug('reserves: %s' % reserves)
-                logging.debug('total supply: %s' % total_supply)
-                logging.debug('pair_balance: %s.' % pair_balance)
-                logging.debug('amount0: %s' % token0_pool_amount)
-                logging.debug('amount1: %s' % token1_pool_amount)
-                
-                if str(token0) != str(value_token):
-                    token0_value = Web3.fromWei(self._get_amounts_out(1, [token0, value_token])[1], "ether") * token0_pool_amount
-                else:
-                    token0_value = token0_pool_amount
-                
-                if str(token1) != str(value_token):
-                    token1_value = Web3.fromWei(self._get_amounts_out(1, [token1, value_token])[1], "ether") * token1_pool_amount
-                else:
-                    token1_value = token1_pool_amount
-                
-                total_value = token1_value + token0_value
-                
-                result = {
-                    "reserves": reserves,
-                    "token0": token0,
-                    "token1": token1,
-                    "token0_name": token0_name,
-                    "token1_name": token1_name,
-                    "symbol": "%s<>%s" % (token0_name, token1_name),
-                    "token0_amount": token0_pool_amount,
-                    "token1_amount": token1_pool_amount,
-                    "total_value": total_value
-                }
-                break
-            except:
-                logging.debug(traceback.format_exc())
+    def _get_lp_balances(self, pair_address, addresses, max_tries=None, block_identifier="latest"):
+        # balanceOf for many wallets on one pair, the reads run concurrently.
+        pair_contract = self._get_pair_contract(pair_address)
+        
+        def fetch(address):
+            return self._retry(
+                lambda: pair_contract.functions.balanceOf(address).call(block_identifier=block_identifier),
+                max_tries=max_tries, description='LP balance of %s' % pair_address)
+        
+        return dict(zip(addresses, self._read_many(fetch, addresses)))
+    
+    def _get_pair_metadata(self, pair_address):
+        # tokens, decimals and symbols of a pair never change, so they are only read once.
+        if pair_address in self._pair_metadata:
+            return self._pair_metadata[pair_address]
+        pair_contract = self._get_pair_contract(pair_address)
+        token0 = pair_contract.functions.token0().call()
+        token1 = pair_contract.functions.token1().call()
+        token0_contract = self._get_token_contract(token0)
+        token1_contract = self._get_token_contract(token1)
+        metadata = {
+            "token0": token0,
+            "token1": token1,
+            "token0_decimals": token0_contract.functions.decimals().call(),
+            "token1_decimals": token1_contract.functions.decimals().call(),
+            "token0_name": token0_contract.functions.symbol().call(),
+            "token1_name": token1_contract.functions.symbol().call()
+        }
+        self._pair_metadata[pair_address] = metadata
+        return metadata
+    
+    def _get_pool_state(self, pair_address, value_token=None):
+        # the part of the pool info that is the same for every wallet. raises on rpc errors.
+        if value_token is None:
+            value_token = self._weth()
+        metadata = self._get_pair_metadata(pair_address)
+        pair_contract = self._get_pair_contract(pair_address)
+        reserves = pair_contract.functions.getReserves().call()
+        total_supply = pair_contract.functions.totalSupply().call()
+        if self.route_finder is not None:
+            self.route_finder.update_reserves(pair_address, reserves[0], reserves[1])
+        
+        # fix the decimals to the correct places.
+        # DO NOT USE fromWei()!
+        reserves[0] = self._fix_decimal(reserves[0], decimals=metadata["token0_decimals"])
+        reserves[1] = self._fix_decimal(reserves[1], decimals=metadata["token1_decimals"])
+        
+        state = dict(metadata)
+        state["reserves"] = reserves
+        state["total_supply"] = Web3.fromWei(total_supply, "ether")
+        state["token0_price"] = self._get_value_price(metadata["token0"], value_token)
+        state["token1_price"] = self._get_value_price(metadata["token1"], value_token)
+        state["value_token"] = value_token
+        return state
+    
+    def _get_value_price(self, token, value_token, block_identifier="latest"):
+        # price of token in value token, 1 for the value token itself. raises on rpc errors and reverts,
+        # not retried here so the caller's single retry policy sees the real error (reverts fail fast).
+        if str(token) == str(value_token):
+            return Decimal(1)
+        amounts = self.router_contract.functions.getAmountsOut(1, [token, value_token]).call(block_identifier=block_identifier)
+        return Web3.fromWei(amounts[1], "ether")
+    
+    def _get_mid_price(self, token, value_token, max_tries=None):
+        # price of one whole token in whole value tokens from the reserves of their pair, without the swap
+        # fee or price impact a getAmountsOut quote has. None without a pair or on rpc errors.
+        
+        def read():
+            pair_address = self._get_pair_address(token, value_token)
+            if int(pair_address, 16) == 0:
                 return None
-        return result
-
-    
\ No newline at end of file
+            metadata = self._get_pair_metadata(pair_address)
+            reserves = self._get_pair_contract(pair_address).functions.getReserves().call()
+            if reserves[0] == 0 or reserves[1] == 0:
+                return None
+            reserve0 = Decimal(reserves[0]) / Decimal(10 ** metadata["token0_decimals"])
+            reserve1 = Decimal(reserves[1]) / Decimal(10 ** metadata["token1_decimals"])
+            if str(metadata["token0"]).lower() == str(token).lower():
+                return reserve1 / reserve0
+            return reserve0 / reserve1
+        
+        try:
+            return self.read_policy.call(read, max_tries=max_tries, description='mid price of %s' % token)
+        except Exception as e:
+            logging.info('Could not read the mid price of %s (%s): %s' % (token, classify_error(e), error_message(e)))
+            logging.debug(traceback.format_exc())
+        return None
+    
+    def _get_block_number(self, max_age=BLOCK_NUMBER_MAX_AGE):
+        # the latest block number, re-read when the last read is older than max_age seconds. raises on rpc errors.
+        read_at, block_number = self._block_number
+        if block_number is None or time.time() - read_at > max_age:
+            block_number = self.w3.eth.block_number
+            self._block_number = (time.time(), block_number)
+        return block_number
+    
+    def _pool_amounts(self, state, pair_balance):
+        # (token0 amount, token1 amount, total value) of pair_balance LP tokens, no rpc calls.
+        reserves = state["reserves"]
+        total_supply = state["total_supply"]
+        pair_balance = Web3.fromWei(pair_balance, "ether")
+        
+        # Find the amount for both sides of the pair.
+        token0_pool_amount = Decimal(pair_balance) / (Decimal(total_supply) / Decimal(reserves[0]))
+        token1_pool_amount = Decimal(pair_balance) / (Decimal(total_supply) / Decimal(reserves[1]))
+        
+        logging.debug('reserves: %s' % reserves)
+        logging.debug('total supply: %s' % total_supply)
+        logging.debug('pair_balance: %s.' % pair_balance)
+        logging.debug('amount0: %s' % token0_pool_amount)
+        logging.debug('amount1: %s' % token1_pool_amount)
+        
+        total_value = state["token0_price"] * token0_pool_amount + state["token1_price"] * token1_pool_amount
+        return token0_pool_amount, token1_pool_amount, total_value
+    
+    def _pool_info_from_state(self, state, pair_balance):
+        # the wallet specific part of the pool info, no rpc calls.
+        token0_pool_amount, token1_pool_amount, total_value = self._pool_amounts(state, pair_balance)
+        return {
+            "reserves": list(state["reserves"]),
+            "token0": state["token0"],
+            "token1": state["token1"],
+            "token0_name": state["token0_name"],
+            "token1_name": state["token1_name"],
+            "symbol": "%s<>%s" % (state["token0_name"], state["token1_name"]),
+            "token0_amount": token0_pool_amount,
+            "token1_amount": token1_pool_amount,
+            "total_value": total_value
+        }
+    
+    def _pool_symbol(self, pair_address):
+        # e.g. WBNB<>BUSD, from the metadata cache.
+        metadata = self._get_pair_metadata(pair_address)
+        return "%s<>%s" % (metadata["token0_name"], metadata["token1_name"])
+    
+    def _read_pool_state(self, table, pool_id, value_token=None):
+        # reserves, supply and token prices of a pool, written into its poolstate.PoolTable row.
+        # the same for every wallet. all reads are at one block, kept in the row's read_block. raises on rpc errors.
+        if value_token is None:
+            value_token = self._weth()
+        pair_address = table.address[pool_id]
+        metadata = self._get_pair_metadata(pair_address)
+        pair_contract = self._get_pair_contract(pair_address)
+        block_number = self._get_block_number()
+        reserves = pair_contract.functions.getReserves().call(block_identifier=block_number)
+        total_supply = pair_contract.functions.totalSupply().call(block_identifier=block_number)
+        token0_price = self._get_value_price(metadata["token0"], value_token, block_identifier=block_number)
+        token1_price = self._get_value_price(metadata["token1"], value_token, block_identifier=block_number)
+        if self.route_finder is not None:
+            self.route_finder.update_reserves(pair_address, reserves[0], reserves[1])
+        table.reserve0[pool_id] = reserves[0] / 10 ** metadata["token0_decimals"]
+        table.reserve1[pool_id] = reserves[1] / 10 ** metadata["token1_decimals"]
+        table.total_supply[pool_id] = total_supply / 10 ** 18
+        table.token0_price[pool_id] = float(token0_price)
+        table.token1_price[pool_id] = float(token1_price)
+        table.read_block[pool_id] = block_number
+    
+    def _read_pool_row(self, table, pool_id, value_token=None):
+        # refreshes this account's poolstate.PoolTable row in place. raises on rpc errors.
+        self._read_pool_state(table, pool_id, value_token=value_token)
+        pair_balance = self._get_pair_contract(table.address[pool_id]).functions.balanceOf(self.address).call(
+            block_identifier=table.read_block[pool_id])
+        table.update_value(pool_id, pair_balance / 10 ** 18)
+    
+    def _get_pool_info(self, pair_address, value_token=None, max_tries=None):
+        
+        def read():
+            state = self._get_pool_state(pair_address, value_token=value_token)
+            pair_balance = self._get_pair_contract(pair_address).functions.balanceOf(self.address).call()
+            return self._pool_info_from_state(state, pair_balance)
+        
+        return self._retry(read, max_tries=max_tries, description='pool %s' % pair_address)
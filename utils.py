@@ -1,8 +1,7 @@
 from web3 import Web3
 from decimal import Decimal
 import logging
-import traceback
-import requests
+from pricefeed import get_price_feed
 
 def wei2eth(wei, unit="ether"):
     return Web3.fromWei(wei, unit)
@@ -48,20 +47,9 @@ def is_percent_up(previous_amount, current_amount, percent_up):
 
 def pancakeswap_api_get_price(token_address, max_tries=1):
     # response example: {"updated_at":1644451690368,"data":{"name":"USD Coin","symbol":"USDC","price":"0.999362623429255457703972330882","price_BNB":"0.002364980172183089994929542565945"}}
-    for _ in range(max_tries):
-        try:
-            response = requests.get('https://api.pancakeswap.info/api/v2/tokens/%s' % token_address)
-            return response.json()
-        except:
-            logging.info(traceback.format_exc())
-    return None
+    # cached, and on a shared session, see pricefeed.py.
+    return get_price_feed().pancakeswap_token(token_address, max_tries=max_tries)
 
 def binance_api_get_price(symbol, max_tries=1):
     # example symbol, BNBBUSD
-    for _ in range(max_tries):
-        try:
-            response = requests.get('https://api.binance.com/api/v3/ticker/price?symbol=%s' % symbol)
-            return response.json()
-        except:
-            logging.info(traceback.format_exc())
-    return None
+    return get_price_feed().binance_ticker(symbol, max_tries=max_tries)